@@ -1,143 +1,2501 @@
-from collections import deque
+from array import array
+from collections import OrderedDict, deque
+from contextlib import ExitStack, contextmanager
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import atexit
+import bisect
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
 
 import tkinter as tk
 from tkinter import font, ttk, messagebox
-import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import random
 
 
+class Metrics:
+    """
+    Реєстр метрик швидкодії: час етапів, лічильники та трасування окремих запитів
+
+    Вимкнений за замовчуванням - тоді виміри не виконуються. Вмикається параметром --metrics,
+    а --profile додатково зберігає профіль cProfile для кожного пошуку маршруту.
+    """
+
+    def __init__(self, max_traces=100):
+        """
+        max_traces - кількість останніх трасувань запитів, що зберігаються
+        """
+        self.enabled = False
+        self.profile = False
+        self._stages = {}
+        self._counters = {}
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Вимірювання часу виконання етапу (використовується як with metrics.stage(...))
+
+        name - назва етапу
+        """
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_time(name, time.perf_counter() - started)
+
+    def record_time(self, name, seconds):
+        """
+        Додавання виміру часу етапу
+
+        name - назва етапу
+        seconds - тривалість у секундах
+        """
+        with self._lock:
+            stage = self._stages.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stage['count'] += 1
+            stage['total'] += seconds
+            stage['max'] = max(stage['max'], seconds)
+
+    def count(self, name, value=1):
+        """
+        Збільшення лічильника
+
+        name - назва лічильника
+        value - величина, на яку збільшується лічильник
+        """
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def peak(self, name, value):
+        """
+        Оновлення лічильника найбільшим значенням
+
+        name - назва лічильника
+        value - нове значення
+        """
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = max(self._counters.get(name, value), value)
+
+    def trace(self, record):
+        """
+        Збереження трасування окремого запиту
+
+        record - словник з інформацією про запит
+        """
+        if self.enabled:
+            with self._lock:
+                self._traces.append(record)
+
+    def reset(self):
+        """
+        Видалення усіх зібраних метрик
+        """
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._traces.clear()
+
+    def to_dict(self):
+        """
+        Отримання зібраних метрик
+
+        повертає: словник з часом етапів (мс), лічильниками, статистикою кешу маршрутів та трасуваннями
+        """
+        with self._lock:
+            stages = {name: {'count': stage['count'],
+                             'total_ms': stage['total'] * 1000,
+                             'mean_ms': stage['total'] / stage['count'] * 1000,
+                             'max_ms': stage['max'] * 1000}
+                      for name, stage in sorted(self._stages.items())}
+            return {
+                'enabled': self.enabled,
+                'stages': stages,
+                'counters': dict(sorted(self._counters.items())),
+                'journey_cache': journey_cache.stats(),
+                'traces': list(self._traces),
+            }
+
+    def format_text(self):
+        """
+        Отримання зібраних метрик у текстовому вигляді
+
+        повертає: текст з таблицею етапів та лічильниками
+        """
+        data = self.to_dict()
+        lines = [f"{'етап':<24}{'к-сть':>8}{'всього, мс':>14}{'середнє, мс':>14}{'макс, мс':>12}"]
+        for name, stage in data['stages'].items():
+            lines.append(f"{name:<24}{stage['count']:>8}{stage['total_ms']:>14.3f}"
+                         f"{stage['mean_ms']:>14.3f}{stage['max_ms']:>12.3f}")
+        for name, value in data['counters'].items():
+            lines.append(f"{name}: {value}")
+        lines.append(f"journey_cache: {data['journey_cache']}")
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+class Route:
+    """
+    Маршрут трамваю
+
+    Зупинки зберігаються як масиви цілочисельних ідентифікаторів у спільній для всієї мережі таблиці
+    назв зупинок, тож кожна назва зберігається один раз, а перевірка належності зупинки маршруту -
+    це перевірка цілого числа у множині.
+    """
+    __slots__ = ('number', 'name', 'direct_ids', 'reverse_ids', 'stop_ids', 'stop_names', 'timetable')
+
+    def __init__(self, number, name, direct_ids, reverse_ids, stop_names, timetable=None):
+        """
+        number - номер трамваю
+        name - назва маршруту
+        direct_ids - ідентифікатори зупинок прямого напрямку
+        reverse_ids - ідентифікатори зупинок зворотного напрямку
+        stop_names - спільна таблиця назв зупинок, впорядкована за ідентифікатором
+        timetable - розклад руху (див. make_timetable) або None, якщо у файлі його не вказано
+        """
+        self.number = number
+        self.name = name
+        self.direct_ids = array('i', direct_ids)
+        self.reverse_ids = array('i', reverse_ids)
+        self.stop_ids = frozenset(self.direct_ids + self.reverse_ids)
+        self.stop_names = stop_names
+        self.timetable = timetable
+
+    @property
+    def direct(self):
+        """
+        Список назв зупинок прямого напрямку
+        """
+        return [self.stop_names[stop_id] for stop_id in self.direct_ids]
+
+    @property
+    def reverse(self):
+        """
+        Список назв зупинок зворотного напрямку
+        """
+        return [self.stop_names[stop_id] for stop_id in self.reverse_ids]
+
+    def __repr__(self):
+        return f"Route({self.number}, {self.name!r})"
+
+
+DIRECT_ROUTE_PREFIX = "Прямий напрямок:"
+REVERSE_ROUTE_PREFIX = "Зворотній напрямок:"
+# Optional timetable lines of a route block: minutes between consecutive stops of each
+# direction ("2 - 3 - 2"), minutes between departures and the first and last departure ("05:30 - 23:30");
+# the reverse direction has the same headway and hours as the direct one unless its own lines are given
+DIRECT_TIMES_PREFIX = "Час прямого напрямку:"
+REVERSE_TIMES_PREFIX = "Час зворотного напрямку:"
+HEADWAY_PREFIX = "Інтервал:"
+SERVICE_HOURS_PREFIX = "Години руху:"
+REVERSE_HEADWAY_PREFIX = "Інтервал зворотного напрямку:"
+REVERSE_SERVICE_HOURS_PREFIX = "Години руху зворотного напрямку:"
+
+# Timetable values used for routes (or parts of a timetable) not given in the file
+DEFAULT_SEGMENT_MINUTES = 2
+DEFAULT_HEADWAY_MINUTES = 10
+DEFAULT_SERVICE_HOURS = (5 * 60 + 30, 23 * 60 + 30)
+
+
+def parse_clock(text):
+    """
+    Перетворення часу доби у кількість хвилин від півночі
+
+    text - час у форматі ГГ:ХХ
+    повертає: кількість хвилин від півночі
+    """
+    hours, separator, minutes = text.strip().partition(':')
+    if not separator or not hours.isdigit() or not minutes.isdigit() or int(minutes) >= 60:
+        raise ValueError(f"Некоректний час '{text.strip()}', очікувався формат ГГ:ХХ")
+    return int(hours) * 60 + int(minutes)
+
+
+def format_clock(minutes):
+    """
+    Перетворення кількості хвилин від півночі у час доби
+
+    minutes - кількість хвилин від півночі (може перевищувати добу)
+    повертає: час у форматі ГГ:ХХ
+    """
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+
+def make_timetable(direct_length, reverse_length, direct_minutes=None, reverse_minutes=None,
+                   headway=None, service_hours=None, reverse_headway=None, reverse_service_hours=None):
+    """
+    Створення розкладу руху маршруту з заповненням невказаних значень типовими
+
+    direct_length - кількість зупинок прямого напрямку
+    reverse_length - кількість зупинок зворотного напрямку
+    direct_minutes - хвилини між сусідніми зупинками прямого напрямку або None
+    reverse_minutes - хвилини між сусідніми зупинками зворотного напрямку або None
+    headway - хвилини між відправленнями прямого напрямку або None
+    service_hours - кортеж (перше, останнє відправлення) прямого напрямку у хвилинах від півночі або None
+    reverse_headway - хвилини між відправленнями зворотного напрямку або None (як у прямого)
+    reverse_service_hours - кортеж (перше, останнє відправлення) зворотного напрямку або None (як у прямого)
+    повертає: словник розкладу:
+        direct_minutes, reverse_minutes - масиви хвилин між сусідніми зупинками кожного напрямку
+        headway, reverse_headway - хвилини між відправленнями з початкової зупинки кожного напрямку
+        first, last, reverse_first, reverse_last - перше та останнє відправлення з початкової зупинки
+                                                   кожного напрямку у хвилинах від півночі
+    """
+    headway = headway or DEFAULT_HEADWAY_MINUTES
+    first, last = service_hours or DEFAULT_SERVICE_HOURS
+    reverse_first, reverse_last = reverse_service_hours or (first, last)
+    return {
+        'direct_minutes': array('i', direct_minutes or [DEFAULT_SEGMENT_MINUTES] * (direct_length - 1)),
+        'reverse_minutes': array('i', reverse_minutes or [DEFAULT_SEGMENT_MINUTES] * (reverse_length - 1)),
+        'headway': headway,
+        'first': first,
+        'last': last,
+        'reverse_headway': reverse_headway or headway,
+        'reverse_first': reverse_first,
+        'reverse_last': reverse_last,
+    }
+
+
+def timetable_schedule(timetable, direction):
+    """
+    Інтервал та години руху одного напрямку маршруту
+
+    timetable - розклад руху (див. make_timetable)
+    direction - 1 для прямого напрямку, 2 для зворотного
+    повертає: кортеж (хвилини між відправленнями, перше відправлення, останнє відправлення)
+    """
+    if direction == 1:
+        return timetable['headway'], timetable['first'], timetable['last']
+    return timetable['reverse_headway'], timetable['reverse_first'], timetable['reverse_last']
+
+
+def _parse_minutes(text, line_number):
+    values = [value.strip() for value in text.split(" - ")]
+    if not all(value.isdigit() and int(value) > 0 for value in values):
+        raise ValueError(f"Рядок {line_number}: час руху має бути додатною кількістю хвилин через ' - '")
+    return [int(value) for value in values]
+
+
+def _parse_service_hours(text, line_number):
+    first, separator, last = text.partition(" - ")
+    try:
+        return parse_clock(first), parse_clock(last)
+    except ValueError as error:
+        raise ValueError(f"Рядок {line_number}: {error}") from None
+
+
+def iter_tram_records(lines, first_line=1):
+    """
+    Потоковий розбір даних про трамвайні маршрути по одному маршруту за раз
+
+    Рядки читаються з ітератора (наприклад, відкритого файлу), тож увесь текст не зберігається у пам'яті.
+    Кожен блок має складатися з номера трамваю, назви маршруту та рядків прямого і зворотного напрямків,
+    а також може містити рядки розкладу (DIRECT_TIMES_PREFIX, REVERSE_TIMES_PREFIX, HEADWAY_PREFIX,
+    SERVICE_HOURS_PREFIX, REVERSE_HEADWAY_PREFIX, REVERSE_SERVICE_HOURS_PREFIX).
+
+    lines - ітератор рядків у форматі TramsInfo.txt
+    first_line - номер першого рядка у файлі (для повідомлень про помилки)
+    повертає: генератор кортежів (номер трамваю, назва маршруту, прямий напрямок, зворотній напрямок,
+              розклад руху або None, якщо рядків розкладу у блоці немає)
+    """
+    tram = None
+    route_name = None
+    direct_route = None
+    reverse_route = None
+    block_line = 0
+    timing = {}
+
+    def finish_block():
+        if direct_route is None or reverse_route is None:
+            raise ValueError(f"Рядок {block_line}: для трамваю №{tram} не вказано обидва напрямки руху")
+        if not timing:
+            return tram, route_name, direct_route, reverse_route, None
+        for key, route in [('direct_minutes', direct_route), ('reverse_minutes', reverse_route)]:
+            if key in timing and len(timing[key]) != len(route) - 1:
+                raise ValueError(f"Рядок {block_line}: для трамваю №{tram} кількість значень часу руху "
+                                 f"має дорівнювати кількості перегонів ({len(route) - 1})")
+        return tram, route_name, direct_route, reverse_route, make_timetable(len(direct_route),
+                                                                            len(reverse_route), **timing)
+
+    for line_number, line in enumerate(lines, first_line):
+        line = line.strip()
+        if not line:
+            continue
+
+        # The line after a tram number is always the route name, even if it starts with a digit
+        if tram is not None and route_name is None:
+            route_name = line
+
+        # Detect new tram number
+        elif line.isdigit():
+            if tram is not None:
+                yield finish_block()
+            tram = int(line)
+            route_name = None
+            direct_route = None
+            reverse_route = None
+            block_line = line_number
+            timing = {}
+
+        elif tram is None:
+            raise ValueError(f"Рядок {line_number}: очікувався номер трамваю")
+
+        # Parse the direct route
+        elif line.startswith(DIRECT_ROUTE_PREFIX):
+            direct_route = [stop.strip() for stop in line[len(DIRECT_ROUTE_PREFIX):].split(" - ")]
+
+        # Parse the reverse route
+        elif line.startswith(REVERSE_ROUTE_PREFIX):
+            reverse_route = [stop.strip() for stop in line[len(REVERSE_ROUTE_PREFIX):].split(" - ")]
+
+        # Parse the optional timetable
+        elif line.startswith(DIRECT_TIMES_PREFIX):
+            timing['direct_minutes'] = _parse_minutes(line[len(DIRECT_TIMES_PREFIX):], line_number)
+
+        elif line.startswith(REVERSE_TIMES_PREFIX):
+            timing['reverse_minutes'] = _parse_minutes(line[len(REVERSE_TIMES_PREFIX):], line_number)
+
+        elif line.startswith(HEADWAY_PREFIX):
+            timing['headway'] = _parse_minutes(line[len(HEADWAY_PREFIX):], line_number)[0]
+
+        elif line.startswith(SERVICE_HOURS_PREFIX):
+            timing['service_hours'] = _parse_service_hours(line[len(SERVICE_HOURS_PREFIX):], line_number)
+
+        elif line.startswith(REVERSE_HEADWAY_PREFIX):
+            timing['reverse_headway'] = _parse_minutes(line[len(REVERSE_HEADWAY_PREFIX):], line_number)[0]
+
+        elif line.startswith(REVERSE_SERVICE_HOURS_PREFIX):
+            timing['reverse_service_hours'] = _parse_service_hours(line[len(REVERSE_SERVICE_HOURS_PREFIX):],
+                                                                   line_number)
+
+        else:
+            raise ValueError(f"Рядок {line_number}: невідомий формат рядка для трамваю №{tram}")
+
+    # Save the last tram's route
+    if tram is not None:
+        yield finish_block()
+
+
+def split_tram_blocks(lines):
+    """
+    Розбиття рядків файлу на блоки окремих маршрутів без розбору зупинок
+
+    lines - ітератор рядків у форматі TramsInfo.txt
+    повертає: генератор кортежів (номер першого рядка блоку, список рядків блоку)
+    """
+    block = []
+    first_line = 1
+    expect_name = False
+    for line_number, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if expect_name and stripped:
+            # The route name may itself be a number
+            expect_name = False
+        elif stripped.isdigit():
+            if block:
+                yield first_line, block
+            block = []
+            first_line = line_number
+            expect_name = True
+        block.append(line)
+    if block:
+        yield first_line, block
+
+
 def process_tram_file(file_path):
     """
-    Обробка файлу з інформацією про трамвайні маршрути
+    Обробка файлу з інформацією про трамвайні маршрути
+
+    Файл читається потоково, а індекс мережі будується одночасно з розбором маршрутів.
+
+    file_path - шлях до файлу з інформацією про трамвайні маршрути
+    повертає: словник маршрутів (Route) за номером трамваю
+    """
+    with metrics.stage('parse'), open(file_path, 'r', encoding='utf-8') as file:
+        trams = build_trams(iter_tram_records(file), f"файлі {file_path}")
+    metrics.count('parse.routes', len(trams))
+    return trams
+
+
+def build_trams(records, source):
+    """
+    Побудова словника маршрутів з потоку записів разом з індексом мережі
+
+    records - ітератор кортежів у форматі iter_tram_records
+    source - опис джерела даних для повідомлень про помилки (наприклад, "файлі TramsInfo.txt")
+    повертає: словник маршрутів (Route) за номером трамваю
+    """
+    trams = {}
+    index = _new_network_index()
+    digest = hashlib.sha1()
+
+    for tram, route_name, direct_route, reverse_route, timetable in records:
+        if tram in trams:
+            raise ValueError(f"Трамвай №{tram} описано у {source} більше одного разу")
+        route = Route(tram, route_name, _intern_stops(index, direct_route),
+                      _intern_stops(index, reverse_route), index['stop_names'], timetable)
+        trams[tram] = route
+        _add_route_to_index(index, route)
+        _update_fingerprint(digest, route)
+
+    index['version'] = digest.hexdigest()
+    _register_network_index(trams, index)
+    return trams
+
+
+def write_tram_file(tram_routes, file):
+    """
+    Запис маршрутів у форматі TramsInfo.txt (з рядками розкладу для маршрутів, що його мають)
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    file - відкритий текстовий файл
+    """
+    for number, route in tram_routes.items():
+        file.write(f"{number:02d}\n{route.name}\n"
+                   f"{DIRECT_ROUTE_PREFIX}{' - '.join(route.direct)}\n"
+                   f"{REVERSE_ROUTE_PREFIX}{' - '.join(route.reverse)}\n")
+        timetable = route.timetable
+        if timetable is not None:
+            # Service may run past midnight, so hours are written without wrapping around the day
+            first, last, reverse_first, reverse_last = (
+                f"{minutes // 60:02d}:{minutes % 60:02d}"
+                for minutes in (timetable['first'], timetable['last'], timetable['reverse_first'], timetable['reverse_last']))
+            file.write(f"{DIRECT_TIMES_PREFIX}{' - '.join(map(str, timetable['direct_minutes']))}\n"
+                       f"{REVERSE_TIMES_PREFIX}{' - '.join(map(str, timetable['reverse_minutes']))}\n"
+                       f"{HEADWAY_PREFIX}{timetable['headway']}\n"
+                       f"{SERVICE_HOURS_PREFIX}{first} - {last}\n")
+            if timetable['reverse_headway'] != timetable['headway']:
+                file.write(f"{REVERSE_HEADWAY_PREFIX}{timetable['reverse_headway']}\n")
+            if (reverse_first, reverse_last) != (first, last):
+                file.write(f"{REVERSE_SERVICE_HOURS_PREFIX}{reverse_first} - {reverse_last}\n")
+
+
+def network_fingerprint(tram_routes):
+    """
+    Обчислення відбитка даних про маршрути, який змінюється при будь-якій зміні маршрутів
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: рядок з шістнадцятковим відбитком
+    """
+    digest = hashlib.sha1()
+    for route in tram_routes.values():
+        _update_fingerprint(digest, route)
+    return digest.hexdigest()
+
+
+def _update_fingerprint(digest, route):
+    """
+    Додавання маршруту трамваю до відбитка даних
+
+    digest - об'єкт hashlib, у якому обчислюється відбиток
+    route - маршрут трамваю
+    """
+    digest.update(f"{route.number}\n{route.name}\n{' - '.join(route.direct)}\n{' - '.join(route.reverse)}\n"
+                  .encode('utf-8'))
+    # Routes without a timetable keep the fingerprint they had before timetables were supported
+    timetable = route.timetable
+    if timetable is not None:
+        digest.update(f"{list(timetable['direct_minutes'])}{list(timetable['reverse_minutes'])}"
+                      f"{timetable['headway']},{timetable['first']},{timetable['last']}\n".encode('utf-8'))
+        # The same holds for routes whose reverse direction runs on the direct direction's schedule
+        reverse_schedule = timetable_schedule(timetable, 2)
+        if reverse_schedule != timetable_schedule(timetable, 1):
+            digest.update(f"{reverse_schedule}\n".encode('utf-8'))
+
+
+def build_network_index(tram_routes):
+    """
+    Побудова індексу трамвайної мережі для швидкого пошуку маршрутів
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: словник з індексом мережі:
+        stop_ids - відображення назви зупинки у її цілочисельний ідентифікатор
+        stop_names - спільна з маршрутами таблиця назв зупинок, впорядкована за ідентифікатором
+        routes - список кортежів (номер трамваю, напрямок, масив ідентифікаторів зупинок)
+        stop_routes - для кожної зупинки список входжень (індекс маршруту, позиція на маршруті)
+        tram_numbers - номери трамваїв, позиція у списку є номером біта трамваю у stop_trams
+        stop_trams - для кожної зупинки бітова множина (int) трамваїв, що через неї проходять
+        version - відбиток даних, з яких побудовано індекс
+        stops_sorted - список зупинок за українським алфавітом (заповнюється get_all_stops_sorted)
+        stop_search - індекс пошуку зупинок за назвою (заповнюється get_stop_search_index)
+        layout - координати зупинок на схемі мережі (заповнюється get_network_layout)
+        layout_seed - координати зупинок попередньої версії даних для обчислення layout (заповнюється reload_trams)
+        connections - з'єднання всіх рейсів за розкладом (заповнюється get_connections)
+        route_arrays - CSR-представлення напрямків маршрутів (заповнюється get_route_arrays)
+        transfer_graph - граф пересадок між напрямками маршрутів (заповнюється get_transfer_graph)
+        route_reach - напрямки, досяжні з кожної зупинки та з яких досяжна кожна зупинка (заповнюється
+                      _reachable_routes)
+        corridors - частини напрямків зі спільними коридорами для _run_rounds (заповнюється get_corridors)
+    """
+    index = _new_network_index()
+    digest = hashlib.sha1()
+    for route in tram_routes.values():
+        if not index['stop_names']:
+            index['stop_names'] = route.stop_names
+            index['stop_ids'] = {stop: stop_id for stop_id, stop in enumerate(route.stop_names)}
+        elif route.stop_names is not index['stop_names']:
+            raise ValueError(f"Маршрут трамваю №{route.number} використовує іншу таблицю зупинок")
+        _add_route_to_index(index, route)
+        _update_fingerprint(digest, route)
+    index['version'] = digest.hexdigest()
+    return index
+
+
+def _new_network_index():
+    """
+    Створення порожнього індексу мережі, див. build_network_index
+    """
+    return {
+        'stop_ids': {},
+        'stop_names': [],
+        'routes': [],
+        'stop_routes': [],
+        'tram_numbers': [],
+        'stop_trams': [],
+        'version': None,
+        'stops_sorted': None,
+        'stop_search': None,
+        'layout': None,
+        'layout_seed': None,
+        'connections': None,
+        'route_arrays': None,
+        'transfer_graph': None,
+        'route_reach': None,
+        'corridors': None,
+    }
+
+
+def _intern_stops(index, stops):
+    """
+    Отримання ідентифікаторів зупинок з додаванням нових назв до таблиці зупинок індексу
+
+    index - індекс мережі, що будується
+    stops - список назв зупинок
+    повертає: список ідентифікаторів зупинок
+    """
+    stop_ids = index['stop_ids']
+    stop_names = index['stop_names']
+    route_stops = []
+    for stop in stops:
+        stop_id = stop_ids.get(stop)
+        if stop_id is None:
+            stop_id = len(stop_names)
+            stop_ids[stop] = stop_id
+            stop_names.append(stop)
+        route_stops.append(stop_id)
+    return route_stops
+
+
+def _add_route_to_index(index, route):
+    """
+    Додавання обох напрямків маршруту трамваю до індексу мережі
+
+    index - індекс мережі, що будується
+    route - маршрут трамваю, зупинки якого вже є у таблиці зупинок індексу
+    """
+    stop_routes = index['stop_routes']
+    stop_routes.extend([] for _ in range(len(index['stop_names']) - len(stop_routes)))
+    stop_trams = index['stop_trams']
+    stop_trams.extend(0 for _ in range(len(index['stop_names']) - len(stop_trams)))
+
+    for direction, route_stops in [(1, route.direct_ids), (2, route.reverse_ids)]:
+        route_index = len(index['routes'])
+        for position, stop_id in enumerate(route_stops):
+            stop_routes[stop_id].append((route_index, position))
+        index['routes'].append((route.number, direction, route_stops))
+
+    tram_bit = 1 << len(index['tram_numbers'])
+    index['tram_numbers'].append(route.number)
+    for stop_id in route.stop_ids:
+        stop_trams[stop_id] |= tram_bit
+
+
+def _trams_from_bits(index, tram_bits):
+    """
+    Перетворення бітової множини трамваїв на список їх номерів
+
+    index - індекс мережі
+    tram_bits - бітова множина трамваїв (int)
+    повертає: список номерів трамваїв у порядку їх опису у файлі
+    """
+    tram_numbers = index['tram_numbers']
+    trams = []
+    while tram_bits:
+        lowest_bit = tram_bits & -tram_bits
+        trams.append(tram_numbers[lowest_bit.bit_length() - 1])
+        tram_bits ^= lowest_bit
+    return trams
+
+
+def _served_stop_id(index, stop_name):
+    """
+    Ідентифікатор зупинки, через яку проходить хоча б один трамвай
+
+    Таблиця зупинок при перезавантаженні лише зростає, тож зупинки, прибрані з усіх маршрутів,
+    лишаються в index['stop_ids'] і перевіряти запити лише за нею не можна.
+
+    index - індекс мережі
+    stop_name - назва зупинки
+    повертає: ідентифікатор зупинки або None, якщо такої зупинки в мережі немає
+    """
+    stop_id = index['stop_ids'].get(stop_name)
+    if stop_id is None or stop_id >= len(index['stop_routes']) or not index['stop_routes'][stop_id]:
+        return None
+    return stop_id
+
+
+# Indexes are built once per routes dictionary and reused by every query
+_network_indexes = {}
+
+
+def get_network_index(tram_routes):
+    """
+    Отримання індексу мережі для словника маршрутів (будується лише при першому зверненні)
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: індекс мережі, див. build_network_index
+    """
+    cached = _network_indexes.get(id(tram_routes))
+    if cached is None or cached[0] is not tram_routes:
+        return _register_network_index(tram_routes, build_network_index(tram_routes))
+    return cached[1]
+
+
+def _register_network_index(tram_routes, index):
+    """
+    Збереження індексу мережі для словника маршрутів
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    index - індекс мережі, побудований для цих маршрутів
+    повертає: index
+    """
+    if len(_network_indexes) >= 8:
+        _network_indexes.clear()
+    _network_indexes[id(tram_routes)] = (tram_routes, index)
+    return index
+
+
+# Snapshot layout (little-endian): header, string offsets (int32[string_count + 1]),
+# stop IDs in sorted order (int32[stop_count]), tram table (int32[tram_count, 10]: number,
+# route name string, direct length, reverse length, headway, first and last departure of the direct
+# and then of the reverse direction; -1 headways for routes without a timetable), route stop IDs (int32[route_stop_count]), minutes to the next stop
+# of the route (int32[route_stop_count]; 0 for the last stop and routes without a timetable),
+# UTF-8 string data. Strings are the stop names (indexed by stop ID) followed by route names.
+SNAPSHOT_MAGIC = b'TRAMSNAP'
+SNAPSHOT_FORMAT_VERSION = 4
+SNAPSHOT_TRAM_COLUMNS = 10
+SNAPSHOT_HEADER = struct.Struct('<8sIQQ20s5I')
+
+
+def snapshot_path(file_path):
+    """
+    Отримання шляху до бінарного знімка для файлу з інформацією про трамвайні маршрути
+
+    file_path - шлях до файлу з інформацією про трамвайні маршрути
+    повертає: шлях до файлу знімка
+    """
+    return os.path.splitext(file_path)[0] + '.snapshot'
+
+
+def write_snapshot(tram_routes, file_path, snapshot_file):
+    """
+    Запис бінарного знімка розібраних даних про трамвайні маршрути
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    file_path - шлях до файлу, з якого отримано маршрути (для перевірки актуальності знімка)
+    snapshot_file - шлях до файлу знімка
+    """
+    import numpy as np
+
+    index = get_network_index(tram_routes)
+    stop_ids = index['stop_ids']
+    stats = os.stat(file_path)
+
+    strings = index['stop_names'] + [route.name for route in tram_routes.values()]
+    encoded = [string.encode('utf-8') for string in strings]
+    string_offsets = np.zeros(len(encoded) + 1, dtype='<i4')
+    string_offsets[1:] = np.cumsum([len(string) for string in encoded])
+
+    sorted_ids = np.array([stop_ids[stop] for stop in get_all_stops_sorted(tram_routes)], dtype='<i4')
+    tram_table = []
+    route_minutes = []
+    for i, (tram, route) in enumerate(tram_routes.items()):
+        timetable = route.timetable
+        schedule = ([-1] * 6 if timetable is None
+                    else list(timetable_schedule(timetable, 1) + timetable_schedule(timetable, 2)))
+        tram_table.append([tram, len(index['stop_names']) + i, len(route.direct_ids), len(route.reverse_ids)]
+                          + schedule)
+        for key, route_stops in [('direct_minutes', route.direct_ids), ('reverse_minutes', route.reverse_ids)]:
+            route_minutes.extend([0] * len(route_stops) if timetable is None else list(timetable[key]) + [0])
+    tram_table = np.array(tram_table, dtype='<i4').reshape(-1, SNAPSHOT_TRAM_COLUMNS)
+    route_stops = np.array([stop for _, _, stops in index['routes'] for stop in stops], dtype='<i4')
+    route_minutes = np.array(route_minutes, dtype='<i4')
+
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, stats.st_size, stats.st_mtime_ns,
+                                  bytes.fromhex(index['version']), len(index['stop_names']), len(strings),
+                                  len(tram_table), len(route_stops), int(string_offsets[-1]))
+
+    # Write to a temporary file first so that readers never map a half-written snapshot
+    temporary_file = snapshot_file + '.tmp'
+    with open(temporary_file, 'wb') as file:
+        file.write(header)
+        for section in [string_offsets, sorted_ids, tram_table, route_stops, route_minutes]:
+            file.write(section.tobytes())
+        file.write(b''.join(encoded))
+    os.replace(temporary_file, snapshot_file)
+
+
+def load_snapshot(snapshot_file, file_path):
+    """
+    Завантаження даних про трамвайні маршрути з бінарного знімка через mmap
+
+    Масиви знімка читаються безпосередньо з відображеного у пам'ять файлу без розбору тексту
+    (зупинки маршрутів копіюються у масиви Route), а кожна назва зупинки декодується лише один раз
+    і спільна для всіх маршрутів. Знімок приймається лише тоді, коли всі ідентифікатори в межах
+    своїх таблиць, а відбиток розібраних маршрутів збігається з версією в заголовку.
+
+    snapshot_file - шлях до файлу знімка
+    file_path - шлях до файлу, з якого було створено знімок
+    повертає: словник маршрутів (Route) за номером трамваю або None, якщо знімка немає, він застарів
+              або пошкоджений
+    """
+    try:
+        stats = os.stat(file_path)
+        with open(snapshot_file, 'rb') as file:
+            snapshot = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        (magic, format_version, source_size, source_mtime, version, stop_count, string_count,
+         tram_count, route_stop_count, string_bytes) = SNAPSHOT_HEADER.unpack_from(snapshot)
+    except struct.error:
+        return None
+    if (magic != SNAPSHOT_MAGIC or format_version != SNAPSHOT_FORMAT_VERSION
+            or source_size != stats.st_size or source_mtime != stats.st_mtime_ns):
+        return None
+    # A truncated or padded file is rejected before any section is read
+    array_items = string_count + 1 + stop_count + tram_count * SNAPSHOT_TRAM_COLUMNS + 2 * route_stop_count
+    if len(snapshot) != SNAPSHOT_HEADER.size + 4 * array_items + string_bytes:
+        return None
+
+    try:
+        return _read_snapshot(snapshot, version, stop_count, string_count, tram_count, route_stop_count,
+                              string_bytes)
+    except (ValueError, IndexError, struct.error):
+        # Corrupt contents: the caller falls back to parsing the text file
+        return None
+
+
+def _read_snapshot(snapshot, version, stop_count, string_count, tram_count, route_stop_count, string_bytes):
+    """
+    Розбір секцій знімка, розміри яких уже перевірено, див. load_snapshot
+
+    snapshot - відображений у пам'ять файл знімка
+    version, stop_count, string_count, tram_count, route_stop_count, string_bytes - значення із заголовка
+    повертає: словник маршрутів (Route) за номером трамваю
+    """
+    import numpy as np
+
+    offset = SNAPSHOT_HEADER.size
+    string_offsets = np.frombuffer(snapshot, dtype='<i4', count=string_count + 1, offset=offset)
+    offset += string_offsets.nbytes
+    sorted_ids = np.frombuffer(snapshot, dtype='<i4', count=stop_count, offset=offset)
+    offset += sorted_ids.nbytes
+    tram_table = np.frombuffer(snapshot, dtype='<i4', count=tram_count * SNAPSHOT_TRAM_COLUMNS,
+                               offset=offset).reshape(-1, SNAPSHOT_TRAM_COLUMNS)
+    offset += tram_table.nbytes
+    route_stops = np.frombuffer(snapshot, dtype='<i4', count=route_stop_count, offset=offset)
+    offset += route_stops.nbytes
+    route_minutes = np.frombuffer(snapshot, dtype='<i4', count=route_stop_count, offset=offset)
+    offset += route_minutes.nbytes
+
+    bounds = string_offsets.tolist()
+    if bounds[0] != 0 or bounds[-1] != string_bytes or any(start > end for start, end in zip(bounds, bounds[1:])):
+        raise ValueError("Некоректні зміщення рядків у знімку")
+    strings = [snapshot[offset + start:offset + end].decode('utf-8') for start, end in zip(bounds, bounds[1:])]
+    stop_names = strings[:stop_count]
+
+    # Python would silently wrap negative IDs around, so every ID, length and name index is range-checked
+    # before any route is built
+    if not np.array_equal(np.sort(sorted_ids), np.arange(stop_count)):
+        raise ValueError("Некоректний порядок зупинок у знімку")
+    if route_stop_count and (route_stops.min() < 0 or route_stops.max() >= stop_count):
+        raise ValueError("Некоректні ідентифікатори зупинок у знімку")
+    name_indexes = tram_table[:, 1]
+    lengths = tram_table[:, 2:4]
+    if ((name_indexes < stop_count).any() or (name_indexes >= string_count).any() or (lengths < 0).any()
+            or int(lengths.sum()) != route_stop_count or len(np.unique(tram_table[:, 0])) != tram_count):
+        raise ValueError("Некоректна таблиця маршрутів у знімку")
+
+    index = _new_network_index()
+    index['stop_names'] = stop_names
+    index['stop_ids'] = {stop: stop_id for stop_id, stop in enumerate(stop_names)}
+    if len(index['stop_ids']) != stop_count:
+        raise ValueError("Повторювані назви зупинок у знімку")
+    index['version'] = version.hex()
+    index['stops_sorted'] = [stop_names[stop_id] for stop_id in sorted_ids.tolist()]
+
+    trams = {}
+    position = 0
+    for (tram, name_index, direct_length, reverse_length, headway, first, last,
+         reverse_headway, reverse_first, reverse_last) in tram_table.tolist():
+        direct_ids = route_stops[position:position + direct_length].tolist()
+        timetable = None
+        if headway >= 0:
+            timetable = make_timetable(direct_length, reverse_length,
+                                       route_minutes[position:position + direct_length - 1].tolist(),
+                                       route_minutes[position + direct_length:
+                                                     position + direct_length + reverse_length - 1].tolist(),
+                                       headway, (first, last), reverse_headway, (reverse_first, reverse_last))
+        position += direct_length
+        reverse_ids = route_stops[position:position + reverse_length].tolist()
+        position += reverse_length
+        trams[tram] = Route(tram, strings[name_index], direct_ids, reverse_ids, stop_names, timetable)
+        _add_route_to_index(index, trams[tram])
+
+    # Caches are keyed by the version from the header, so the decoded routes must really have it
+    if network_fingerprint(trams) != index['version']:
+        raise ValueError("Відбиток даних знімка не збігається із заголовком")
+    _register_network_index(trams, index)
+    return trams
+
+
+def load_trams(file_path):
+    """
+    Завантаження даних про трамвайні маршрути з актуального бінарного знімка або з текстового файлу
+
+    file_path - шлях до файлу з інформацією про трамвайні маршрути
+    повертає: словник з інформацією про трамвайні маршрути
+    """
+    trams = load_snapshot(snapshot_path(file_path), file_path)
+    if trams is None:
+        trams = process_tram_file(file_path)
+    return trams
+
+
+# GTFS route_type values imported by default (0 - tram, streetcar, light rail)
+GTFS_ROUTE_TYPES = ('0',)
+# Rows of stop_times.txt between progress reports
+GTFS_CHUNK_ROWS = 100000
+
+
+@contextmanager
+def _open_gtfs_table(feed_path, name, required=True):
+    """
+    Відкриття таблиці фіду GTFS для потокового читання
+
+    feed_path - шлях до каталогу або zip-архіву фіду
+    name - назва файлу таблиці (наприклад, stops.txt)
+    required - чи є таблиця обов'язковою
+    повертає: кортеж (словник номерів колонок за назвою, ітератор рядків csv) або None,
+              якщо необов'язкової таблиці у фіді немає
+    """
+    import csv
+    import zipfile
+
+    with ExitStack() as stack:
+        if zipfile.is_zipfile(feed_path):
+            archive = stack.enter_context(zipfile.ZipFile(feed_path))
+            if name not in archive.namelist():
+                file = None
+            else:
+                file = stack.enter_context(io.TextIOWrapper(archive.open(name), encoding='utf-8-sig', newline=''))
+        elif os.path.exists(os.path.join(feed_path, name)):
+            file = stack.enter_context(open(os.path.join(feed_path, name), encoding='utf-8-sig', newline=''))
+        else:
+            file = None
+
+        if file is None:
+            if required:
+                raise ValueError(f"У фіді GTFS {feed_path} немає файлу {name}")
+            yield None
+            return
+
+        reader = csv.reader(file)
+        header = next(reader, [])
+        yield {column.strip(): position for position, column in enumerate(header)}, reader
+
+
+def _gtfs_column(columns, name, table):
+    """
+    Номер обов'язкової колонки таблиці GTFS
+
+    columns - словник номерів колонок за назвою
+    name - назва колонки
+    table - назва файлу таблиці (для повідомлення про помилку)
+    повертає: номер колонки
+    """
+    if name not in columns:
+        raise ValueError(f"У файлі GTFS {table} немає колонки {name}")
+    return columns[name]
+
+
+def _gtfs_minutes(text):
+    """
+    Перетворення часу GTFS (ГГ:ХХ:СС, години можуть перевищувати 24) у хвилини від півночі
+
+    text - час з stop_times.txt
+    повертає: кількість хвилин або None, якщо час не вказано
+    """
+    hours, _, rest = text.strip().partition(':')
+    if not hours:
+        return None
+    return int(hours) * 60 + int(rest[:2])
+
+
+def import_gtfs(feed_path, route_types=GTFS_ROUTE_TYPES, chunk_rows=GTFS_CHUNK_ROWS, progress=None):
+    """
+    Потоковий імпорт трамвайних маршрутів з фіду GTFS (stops.txt, trips.txt, stop_times.txt, routes.txt)
+
+    stop_times.txt читається потоково і має бути згрупований за trip_id (як у фідах більшості
+    перевізників), тож у пам'яті зберігається лише поточний рейс. Рейси згортаються
+    у різні послідовності зупинок для кожного маршруту та напрямку; найчастіша з них стає напрямком
+    маршруту, а час руху, інтервал і години руху цього напрямку беруться з її рейсів. Час зупинок,
+    для яких у stop_times.txt його не вказано, рівномірно розподіляється між сусідніми зупинками з часом.
+    Номер трамваю - route_short_name з routes.txt (або route_id, якщо routes.txt немає), маршрути
+    з нечисловими номерами пропускаються.
+    Зупинки з однаковою назвою (наприклад, платформи однієї зупинки) вважаються однією зупинкою.
+
+    feed_path - шлях до каталогу або zip-архіву фіду
+    route_types - значення route_type маршрутів, що імпортуються (None - усі)
+    chunk_rows - кількість рядків stop_times.txt між викликами progress
+    progress - функція, яка викликається кожні chunk_rows рядків з кількістю прочитаних рядків, або None
+    повертає: кортеж (словник маршрутів за номером трамваю, звіт про імпорт зі статистикою та швидкістю)
+    """
+    started = time.perf_counter()
+    skipped_routes = set()
+
+    # Route ID -> (tram number, route name)
+    route_info = {}
+    with _open_gtfs_table(feed_path, 'routes.txt', required=False) as table:
+        # Without routes.txt the route IDs themselves are taken as tram numbers
+        has_routes = table is not None
+        if has_routes:
+            columns, rows = table
+            route_id = _gtfs_column(columns, 'route_id', 'routes.txt')
+            short_name = columns.get('route_short_name')
+            long_name = columns.get('route_long_name')
+            route_type = columns.get('route_type')
+            for row in rows:
+                if route_types is not None and route_type is not None and row[route_type].strip() not in route_types:
+                    continue
+                number = row[short_name].strip() if short_name is not None else row[route_id].strip()
+                if not number.isdigit():
+                    skipped_routes.add(number or row[route_id])
+                    continue
+                route_info[row[route_id]] = (int(number), row[long_name].strip() if long_name is not None else '')
+
+    # Trip ID -> (tram number, True for the reverse direction)
+    trips = {}
+    with _open_gtfs_table(feed_path, 'trips.txt') as (columns, rows):
+        route_id = _gtfs_column(columns, 'route_id', 'trips.txt')
+        trip_id = _gtfs_column(columns, 'trip_id', 'trips.txt')
+        direction_id = columns.get('direction_id')
+        for row in rows:
+            if has_routes:
+                info = route_info.get(row[route_id])
+            else:
+                info = (int(row[route_id]), '') if row[route_id].isdigit() else None
+            if info is None:
+                continue
+            route_info.setdefault(row[route_id], info)
+            trips[row[trip_id]] = (info[0], direction_id is not None and row[direction_id].strip() == '1')
+
+    # Stop ID -> stop name ID; names are interned so that stop patterns are tuples of integers
+    stop_names = []
+    name_ids = {}
+    stop_name_ids = {}
+    with _open_gtfs_table(feed_path, 'stops.txt') as (columns, rows):
+        stop_id = _gtfs_column(columns, 'stop_id', 'stops.txt')
+        stop_name = _gtfs_column(columns, 'stop_name', 'stops.txt')
+        for row in rows:
+            name = row[stop_name].strip()
+            if name not in name_ids:
+                name_ids[name] = len(stop_names)
+                stop_names.append(name)
+            stop_name_ids[row[stop_id]] = name_ids[name]
+
+    # (tram, reverse, stop pattern) -> [trips, first departure, last departure, minutes between stops]
+    patterns = {}
+    finished_trips = set()
+
+    def finish_trip(trip, stop_times):
+        if trip is None:
+            return
+        finished_trips.add(trip)
+        if trip not in trips:
+            return
+        stop_times.sort()
+        stops = []
+        for _, name_id, arrival, departure in stop_times:
+            arrival, departure = (arrival if arrival is not None else departure,
+                                  departure if departure is not None else arrival)
+            if stops and stops[-1][0] == name_id:
+                # Consecutive platforms of one stop
+                if stops[-1][1] is None:
+                    stops[-1][1] = arrival
+                if departure is not None:
+                    stops[-1][2] = departure
+            else:
+                stops.append([name_id, arrival, departure])
+        if len(stops) < 2:
+            return
+
+        # Stops without times (GTFS allows them between timepoints) get times spread evenly between
+        # the nearest stops that have them
+        timed = [i for i, stop in enumerate(stops) if stop[1] is not None]
+        if timed and timed[0] == 0 and timed[-1] == len(stops) - 1:
+            for previous, following in zip(timed, timed[1:]):
+                start, span = stops[previous][2], following - previous
+                for i in range(previous + 1, following):
+                    stops[i][1] = stops[i][2] = start + round((stops[following][1] - start) * (i - previous) / span)
+
+        tram, reverse = trips[trip]
+        key = (tram, reverse, tuple(stop[0] for stop in stops))
+        departure = stops[0][2]
+        minutes = None
+        if all(stop[1] is not None for stop in stops):
+            minutes = [max(stops[i + 1][1] - stops[i][2], 1) for i in range(len(stops) - 1)]
+        pattern = patterns.get(key)
+        if pattern is None:
+            patterns[key] = [1, departure, departure, minutes]
+        else:
+            pattern[0] += 1
+            if pattern[3] is None:
+                pattern[3] = minutes
+            if departure is not None:
+                pattern[1] = departure if pattern[1] is None else min(pattern[1], departure)
+                pattern[2] = departure if pattern[2] is None else max(pattern[2], departure)
+
+    rows_read = 0
+    with metrics.stage('gtfs.stop_times'), _open_gtfs_table(feed_path, 'stop_times.txt') as (columns, rows):
+        trip_id = _gtfs_column(columns, 'trip_id', 'stop_times.txt')
+        stop_id = _gtfs_column(columns, 'stop_id', 'stop_times.txt')
+        stop_sequence = _gtfs_column(columns, 'stop_sequence', 'stop_times.txt')
+        arrival_time = columns.get('arrival_time')
+        departure_time = columns.get('departure_time')
+
+        current_trip = None
+        stop_times = []
+        for row in rows:
+            trip = row[trip_id]
+            if trip != current_trip:
+                finish_trip(current_trip, stop_times)
+                if trip in finished_trips:
+                    raise ValueError(f"Рядки рейсу {trip} у stop_times.txt фіду {feed_path} "
+                                     f"мають бути записані поспіль")
+                current_trip = trip
+                stop_times = []
+            if trip in trips:
+                if row[stop_id] not in stop_name_ids:
+                    raise ValueError(f"У файлі GTFS stop_times.txt є зупинка {row[stop_id]}, якої немає у stops.txt")
+                stop_times.append((int(row[stop_sequence]), stop_name_ids[row[stop_id]],
+                                   _gtfs_minutes(row[arrival_time]) if arrival_time is not None else None,
+                                   _gtfs_minutes(row[departure_time]) if departure_time is not None else None))
+            rows_read += 1
+            if progress is not None and rows_read % chunk_rows == 0:
+                progress(rows_read)
+        finish_trip(current_trip, stop_times)
+
+    # The most frequent pattern of each direction (the longest of equally frequent ones)
+    directions = {}
+    for (tram, reverse, stops), pattern in patterns.items():
+        chosen = directions.get((tram, reverse))
+        if chosen is None or (pattern[0], len(stops)) > (chosen[1][0], len(chosen[0])):
+            directions[tram, reverse] = (stops, pattern)
+
+    route_names = {number: name for number, name in route_info.values()}
+
+    def schedule(pattern):
+        trip_count, first, last, _ = pattern
+        if first is None:
+            return None, None
+        headway = max(round((last - first) / (trip_count - 1)), 1) if trip_count > 1 else None
+        return headway, (first, last)
+
+    def records():
+        for tram in sorted({tram for tram, _ in directions}):
+            direct = directions.get((tram, False)) or directions[tram, True]
+            reverse = directions.get((tram, True)) if (tram, False) in directions else None
+            direct_stops, direct_pattern = direct
+            direct_minutes = direct_pattern[3]
+            if reverse is None:
+                # One-directional data: ride the same stops back on the same schedule
+                reverse_stops = direct_stops[::-1]
+                reverse_minutes = direct_minutes[::-1] if direct_minutes else None
+                reverse_pattern = direct_pattern
+            else:
+                reverse_stops, reverse_pattern = reverse
+                reverse_minutes = reverse_pattern[3]
+
+            timetable = None
+            headway, service_hours = schedule(direct_pattern)
+            reverse_headway, reverse_service_hours = schedule(reverse_pattern)
+            if service_hours is not None or reverse_service_hours is not None:
+                timetable = make_timetable(len(direct_stops), len(reverse_stops), direct_minutes, reverse_minutes,
+                                           headway, service_hours, reverse_headway, reverse_service_hours)
+            direct_route = [stop_names[stop] for stop in direct_stops]
+            reverse_route = [stop_names[stop] for stop in reverse_stops]
+            name = route_names.get(tram) or f"{direct_route[0]} - {direct_route[-1]}"
+            yield tram, name, direct_route, reverse_route, timetable
+
+    trams = build_trams(records(), f"фіді GTFS {feed_path}")
+    elapsed = time.perf_counter() - started
+    metrics.count('gtfs.rows', rows_read)
+    report = {
+        'feed': feed_path,
+        'stop_times_rows': rows_read,
+        'trips': sum(pattern[0] for pattern in patterns.values()),
+        'patterns': len(patterns),
+        'trams': len(trams),
+        'stops': len(get_network_index(trams)['stop_names']),
+        'skipped_routes': sorted(skipped_routes),
+        'seconds': elapsed,
+        'rows_per_s': rows_read / elapsed if elapsed else None,
+    }
+    return trams, report
+
+
+TRAMS_FILE = 'TramsInfo.txt'
+
+# Route data is loaded on first use, so that importing the module and opening the main window stay fast
+_trams = None
+_trams_lock = threading.Lock()
+# State of TRAMS_FILE the current data was loaded from: {'stat': (size, mtime_ns), 'blocks': {block hash: tram}}
+_trams_source = None
+# Default interval (seconds) between checks of TRAMS_FILE for changes
+RELOAD_INTERVAL = 5.0
+
+
+def get_trams():
+    """
+    Отримання даних про трамвайні маршрути (завантажуються один раз при першому зверненні)
+
+    Після reload_trams повертається новий словник, а запити, що вже виконуються, завершуються
+    на попередньому, тож змінювати повернений словник не можна.
+
+    повертає: словник маршрутів (Route) за номером трамваю
+    """
+    global _trams, _trams_source
+    if _trams is None:
+        with _trams_lock:
+            if _trams is None:
+                stats = os.stat(TRAMS_FILE)
+                stat = (stats.st_size, stats.st_mtime_ns)
+                trams = load_trams(TRAMS_FILE)
+                _trams_source = {'stat': stat, 'blocks': _read_block_hashes(trams, stat)}
+                _trams = trams
+    return _trams
+
+
+def _block_hash(lines):
+    """
+    Хеш тексту блоку маршруту, за яким reload_trams впізнає незмінені маршрути
+
+    lines - список рядків блоку (див. split_tram_blocks)
+    повертає: дайджест SHA-1 (bytes)
+    """
+    return hashlib.sha1(''.join(lines).encode('utf-8')).digest()
+
+
+def _read_block_hashes(trams, stat):
+    """
+    Запам'ятовування хешів блоків TRAMS_FILE, з якого щойно завантажено маршрути
+
+    Без них перше перезавантаження заново розбирало б усі блоки файлу.
+
+    trams - словник маршрутів, завантажених з TRAMS_FILE
+    stat - стан файлу (розмір, mtime_ns) на момент завантаження
+    повертає: відображення хешу блоку у номер трамваю; порожнє, якщо файл встиг змінитися
+    """
+    block_trams = {}
+    with open(TRAMS_FILE, 'r', encoding='utf-8') as file:
+        for _, lines in split_tram_blocks(file):
+            tram_line = lines[0].strip()
+            if tram_line.isdigit() and int(tram_line) in trams:
+                block_trams[_block_hash(lines)] = int(tram_line)
+    stats = os.stat(TRAMS_FILE)
+    if (stats.st_size, stats.st_mtime_ns) != stat:
+        # The text no longer matches the loaded routes, so the next reload parses every block
+        return {}
+    return block_trams
+
+
+def reload_trams():
+    """
+    Перезавантаження даних про трамвайні маршрути, якщо файл TRAMS_FILE змінився
+
+    Заново розбираються лише блоки маршрутів, текст яких змінився; решта маршрутів використовує
+    вже відомі ідентифікатори зупинок. Нові дані підміняють старі однією операцією, тож запити,
+    що виконуються, завершуються на попередній версії.
+
+    повертає: True, якщо дані змінились
+    """
+    global _trams, _trams_source
+    old_trams = get_trams()
+    with _trams_lock:
+        stats = os.stat(TRAMS_FILE)
+        stat = (stats.st_size, stats.st_mtime_ns)
+        if stat == _trams_source['stat']:
+            return False
+
+        with metrics.stage('reload'), open(TRAMS_FILE, 'r', encoding='utf-8') as file:
+            try:
+                trams, index, blocks = _reload_routes(old_trams, split_tram_blocks(file))
+            finally:
+                # A broken file is reported once, not on every check until it is fixed
+                _trams_source = {'stat': stat, 'blocks': _trams_source['blocks']}
+
+        old_index = get_network_index(old_trams)
+        _trams_source = {'stat': stat, 'blocks': blocks}
+        if index['version'] == old_index['version']:
+            return False
+
+        _carry_over_caches(old_index, index)
+        _register_network_index(trams, index)
+        journey_cache.retire(old_index['version'])
+        _trams = trams
+    return True
+
+
+def _reload_routes(old_trams, blocks):
+    """
+    Побудова маршрутів та індексу мережі для нової версії файлу, див. reload_trams
+
+    old_trams - поточний словник маршрутів
+    blocks - блоки маршрутів нової версії файлу (див. split_tram_blocks)
+    повертає: кортеж (словник маршрутів, індекс мережі, відображення хешу блоку у номер трамваю)
+    """
+    old_index = get_network_index(old_trams)
+    known_blocks = _trams_source['blocks']
+
+    # The stop table only grows, so stop IDs of unchanged routes stay valid in the new table
+    index = _new_network_index()
+    index['stop_names'] = list(old_index['stop_names'])
+    index['stop_ids'] = dict(old_index['stop_ids'])
+    digest = hashlib.sha1()
+    trams = {}
+    block_trams = {}
+
+    for first_line, lines in blocks:
+        block_hash = _block_hash(lines)
+        tram = known_blocks.get(block_hash)
+        old_route = old_trams.get(tram)
+        if old_route is not None:
+            route_name, direct_ids, reverse_ids = old_route.name, old_route.direct_ids, old_route.reverse_ids
+            timetable = old_route.timetable
+        else:
+            metrics.count('reload.parsed_blocks')
+            tram, route_name, direct_route, reverse_route, timetable = next(iter_tram_records(lines, first_line))
+            old_route = old_trams.get(tram)
+            if (old_route is not None and old_route.name == route_name
+                    and old_route.direct == direct_route and old_route.reverse == reverse_route):
+                direct_ids, reverse_ids = old_route.direct_ids, old_route.reverse_ids
+            else:
+                direct_ids = _intern_stops(index, direct_route)
+                reverse_ids = _intern_stops(index, reverse_route)
+
+        if tram in trams:
+            raise ValueError(f"Рядок {first_line}: трамвай №{tram} описано у файлі {TRAMS_FILE} більше одного разу")
+        route = Route(tram, route_name, direct_ids, reverse_ids, index['stop_names'], timetable)
+        trams[tram] = route
+        block_trams[block_hash] = tram
+        _add_route_to_index(index, route)
+        _update_fingerprint(digest, route)
+
+    index['version'] = digest.hexdigest()
+    return trams, index, block_trams
+
+
+def _carry_over_caches(old_index, index):
+    """
+    Перенесення кешованих даних попередньої версії мережі до нового індексу
+
+    old_index - індекс попередньої версії даних
+    index - індекс нової версії даних
+    """
+    served_stops = {stop for stop_id, stop in enumerate(index['stop_names']) if index['stop_routes'][stop_id]}
+
+    if old_index['stops_sorted'] is not None:
+        stops_sorted = [stop for stop in old_index['stops_sorted'] if stop in served_stops]
+        for stop in served_stops.difference(stops_sorted):
+            bisect.insort(stops_sorted, stop, key=collation_key)
+        index['stops_sorted'] = stops_sorted
+
+    old_layout = old_index['layout'] or old_index['layout_seed']
+    if old_layout is not None:
+        if served_stops.issubset(old_layout):
+            index['layout'] = {stop: old_layout[stop] for stop in served_stops}
+        else:
+            index['layout_seed'] = {stop: old_layout[stop] for stop in served_stops if stop in old_layout}
+
+
+def watch_trams_file(interval=RELOAD_INTERVAL):
+    """
+    Запуск фонового потоку, що періодично перевіряє файл TRAMS_FILE і перезавантажує змінені дані
+
+    interval - інтервал між перевірками у секундах
+    повертає: потік перевірки
+    """
+    def watch():
+        while True:
+            time.sleep(interval)
+            try:
+                if reload_trams():
+                    print(f"Дані оновлено з файлу {TRAMS_FILE}", file=sys.stderr)
+            except (OSError, ValueError) as error:
+                print(f"Не вдалося оновити дані з файлу {TRAMS_FILE}: {error}", file=sys.stderr)
+
+    thread = threading.Thread(target=watch, name='trams-watcher', daemon=True)
+    thread.start()
+    return thread
+
+
+def find_trams_by_stop(tram_routes, stop_name):
+    """
+        Пошук трамваїв, які зупиняються на заданій зупинці
+
+        tram_routes - словник з інформацією про трамвайні маршрути
+        stop_name - назва зупинки
+        повертає: список номерів трамваїв, які зупиняються на заданій зупинці
+        """
+    index = get_network_index(tram_routes)
+    stop_id = _served_stop_id(index, stop_name)
+    if stop_id is None:
+        return []
+    return _trams_from_bits(index, index['stop_trams'][stop_id])
+
+
+class JourneyCache:
+    """
+    Обмежений LRU-кеш результатів пошуку маршрутів, спільний для всіх вікон
+
+    Результати зберігаються разом з версією даних: коли запит приходить для іншої версії
+    (дані перезавантажено), усі збережені результати відкидаються.
+    """
+
+    def __init__(self, max_size=1024):
+        """
+        max_size - найбільша кількість збережених результатів
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._version = None
+        # Versions replaced by reload_trams, ignored so that in-flight queries cannot flush newer results
+        self._retired = set()
+        self._lock = threading.Lock()
+
+    def get(self, version, key):
+        """
+        Отримання збереженого результату
+
+        version - версія даних, для яких виконується запит
+        key - ключ запиту
+        повертає: збережений результат або None
+        """
+        with self._lock:
+            if version in self._retired:
+                self.misses += 1
+                return None
+            self._check_version(version)
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, version, key, result):
+        """
+        Збереження результату запиту з витісненням найдавніше використаного
+
+        version - версія даних, для яких виконано запит
+        key - ключ запиту
+        result - результат запиту
+        """
+        with self._lock:
+            if version in self._retired:
+                return
+            self._check_version(version)
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Видалення усіх збережених результатів
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Отримання лічильників кешу
+
+        повертає: словник з розміром кешу та кількістю влучань, промахів, витіснень і скидань
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def retire(self, version):
+        """
+        Вилучення результатів застарілої версії даних
+
+        Запити, що ще виконуються на цій версії, більше не читають і не поповнюють кеш.
+
+        version - відбиток застарілих даних
+        """
+        with self._lock:
+            self._retired.add(version)
+            self._check_version(None)
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self._entries.clear()
+                self.invalidations += 1
+            self._version = version
+
+
+journey_cache = JourneyCache()
+
+
+def find_best_route(tram_routes, start_stop, end_stop):
+    """
+        Пошук найкращого маршруту між двома зупинками
+
+        Найкращим вважається маршрут з найменшою кількістю пересадок, а серед таких - з найменшою
+        кількістю зупинок.
+
+        tram_routes - словник з інформацією про трамвайні маршрути
+        start_stop - назва початкової зупинки
+        end_stop - назва кінцевої зупинки
+        повертає: список кортежів з інформацією про маршрут (номер трамваю, список зупинок, кількість зупинок)
+        """
+    journeys = plan_journeys(tram_routes, start_stop, end_stop)
+    if not journeys:
+        return None
+    return journeys[0]
+
+
+def plan_journeys(tram_routes, start_stop, end_stop, max_transfers=None):
+    """
+    Покроковий пошук (RAPTOR) усіх Парето-оптимальних маршрутів між двома зупинками
+
+    Маршрути порівнюються за двома критеріями: кількістю пересадок та кількістю зупинок.
+    Кожен наступний маршрут у результаті має більше пересадок, але менше зупинок, ніж попередній.
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    start_stop - назва початкової зупинки
+    end_stop - назва кінцевої зупинки
+    max_transfers - найбільша допустима кількість пересадок (None - без обмежень)
+    повертає: список маршрутів, впорядкований за кількістю пересадок, кожен маршрут - список кортежів
+              (номер трамваю, список зупинок, кількість зупинок); порожній список, якщо маршрут не знайдено
+    """
+    index = get_network_index(tram_routes)
+    start_id = _served_stop_id(index, start_stop)
+    end_id = _served_stop_id(index, end_stop)
+    if start_id is None or end_id is None:
+        return []
+
+    journeys = journey_cache.get(index['version'], (start_stop, end_stop, max_transfers))
+    if journeys is not None:
+        metrics.count('search.cache_hits')
+        return journeys
+    return _search_journeys(index, start_stop, end_stop, start_id, end_id, max_transfers)
+
+
+def _search_journeys(index, start_stop, end_stop, start_id, end_id, max_transfers, search_state=None):
+    """
+    Пошук маршрутів для plan_journeys з вимірюванням часу та записом результату в кеш
+
+    index - індекс мережі
+    start_stop, end_stop - назви початкової та кінцевої зупинок
+    start_id, end_id - їх ідентифікатори
+    max_transfers - найбільша допустима кількість пересадок (None - без обмежень)
+    search_state - словник, у який записується стан пошуку (див. _plan_journeys), або None
+    повертає: список маршрутів, див. plan_journeys
+    """
+    if not metrics.enabled:
+        journeys = _plan_journeys(index, start_id, end_id, max_transfers, search_state=search_state)
+    else:
+        search_stats = {}
+        profiler = None
+        if metrics.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+        started = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        journeys = _plan_journeys(index, start_id, end_id, max_transfers, search_stats, search_state)
+        if profiler is not None:
+            profiler.disable()
+        elapsed = time.perf_counter() - started
+
+        metrics.record_time('search', elapsed)
+        for name, value in search_stats.items():
+            if name == 'queue_peak':
+                metrics.peak(f'search.{name}', value)
+            else:
+                metrics.count(f'search.{name}', value)
+        trace = {'query': 'plan_journeys', 'start': start_stop, 'end': end_stop,
+                 'search_ms': elapsed * 1000, 'journeys': len(journeys), **search_stats}
+        if profiler is not None:
+            import pstats
+
+            profile_text = io.StringIO()
+            pstats.Stats(profiler, stream=profile_text).sort_stats('cumulative').print_stats(15)
+            trace['profile'] = profile_text.getvalue()
+        metrics.trace(trace)
+
+    journey_cache.put(index['version'], (start_stop, end_stop, max_transfers), journeys)
+    return journeys
+
+
+def _plan_journeys(index, start_id, end_id, max_transfers, stats=None, search_state=None):
+    """
+    Пошук Парето-оптимальних маршрутів за ідентифікаторами зупинок, див. plan_journeys
+
+    stats - словник, у який додаються лічильники пошуку (див. _run_rounds), або None
+    search_state - словник, у який записуються мітки (labels) та попередні зупинки (parents) кроків
+                   пошуку, якщо він відбувся, або None
+    """
+    if start_id == end_id:
+        return [[]]
+
+    # Directions that cannot be part of any journey to the end stop are left out of the scan
+    allowed_routes = _useful_routes(index, start_id, end_id)
+    if not allowed_routes:
+        return []
+
+    max_rounds = None if max_transfers is None else max_transfers + 1
+    labels, parents = _run_rounds(index, start_id, max_rounds, end_id, stats, allowed_routes)
+    if search_state is not None:
+        search_state.update(labels=labels, parents=parents)
+
+    journeys = []
+    for round_number in range(1, len(labels)):
+        if labels[round_number][end_id] < labels[round_number - 1][end_id]:
+            journeys.append(_build_journey(index, parents, end_id, round_number))
+    return journeys
+
+
+def _run_rounds(index, start_id, max_rounds=None, target_id=None, stats=None, allowed_routes=None):
+    """
+    Виконання кроків RAPTOR від початкової зупинки
+
+    На k-му кроці скануються лише маршрути, що проходять через зупинки, покращені на кроці k - 1,
+    починаючи з найранішої такої зупинки на маршруті. Мітка зупинки - найменша кількість зупинок,
+    за яку до неї можна доїхати, використавши не більше k трамваїв. Маршрути проходяться відрізками
+    спільних коридорів (див. get_corridors): відрізок, уже пройдений на цьому кроці іншим маршрутом
+    з не гіршою міткою, пропускається цілком.
+
+    index - індекс мережі
+    start_id - ідентифікатор початкової зупинки
+    max_rounds - найбільша кількість кроків (трамваїв у маршруті), None - поки є покращення
+    target_id - ідентифікатор кінцевої зупинки для відсікання гірших за знайдений маршрутів
+    stats - словник для лічильників пошуку (rounds - кількість кроків, routes_scanned - скановані маршрути,
+            expanded - покращені мітки зупинок, queue_peak - найбільша кількість позначених зупинок,
+            segments_skipped - пропущені відрізки коридорів) або None
+    allowed_routes - множина індексів напрямків, якими дозволено їхати (None - усі)
+    повертає: кортеж (мітки зупинок для кожного кроку, словники попередніх зупинок для кожного кроку)
+    """
+    routes = index['routes']
+    stop_routes = index['stop_routes']
+    route_pieces = get_corridors(index)
+    infinity = float('inf')
+    segments_skipped = 0
+
+    best = [infinity] * len(index['stop_names'])
+    best[start_id] = 0
+    labels = [best[:]]
+    parents = [{}]
+    marked = {start_id}
+
+    while marked and (max_rounds is None or len(labels) <= max_rounds):
+        previous = labels[-1]
+
+        # Earliest improved position on every route serving an improved stop
+        scan_from = {}
+        for stop in marked:
+            for route_index, position in stop_routes[stop]:
+                if position < scan_from.get(route_index, infinity):
+                    if allowed_routes is None or route_index in allowed_routes:
+                        scan_from[route_index] = position
+
+        current = previous[:]
+        round_parents = {}
+        marked = set()
+        # Whole segments scanned this round: segment -> (cost on entering it, best cost on leaving it
+        # when boarding inside the segment, offset of that boarding stop)
+        scanned_segments = {}
+
+        for route_index, first_position in scan_from.items():
+            route_stops = routes[route_index][2]
+            # Label at the boarding stop minus its position, so that cost = boarded + position
+            boarded = previous[route_stops[first_position]] - first_position
+            board_position = first_position
+
+            for segment_id, segment_start, segment_end in route_pieces[route_index]:
+                if segment_end <= first_position:
+                    continue
+                entry = boarded + segment_start
+                whole = segment_id >= 0 and segment_start >= first_position
+                if whole:
+                    scanned = scanned_segments.get(segment_id)
+                    if scanned is not None and scanned[0] <= entry:
+                        # Every stop of the segment already has a label no worse than this route gives it,
+                        # only boarding inside the segment can improve the cost of riding on
+                        if scanned[1] is None:
+                            if scanned[0] == entry:
+                                segments_skipped += 1
+                                continue
+                            scanned = scanned_segments[segment_id] = _segment_boarding(
+                                scanned[0], previous, route_stops, segment_start, segment_end)
+                        if scanned[1] < entry - segment_start + segment_end:
+                            boarded = scanned[1] - segment_end
+                            board_position = segment_start + scanned[2]
+                        segments_skipped += 1
+                        continue
+
+                for position in range(max(segment_start, first_position) + 1, segment_end + 1):
+                    stop = route_stops[position]
+                    cost = boarded + position
+                    if cost < best[stop] and (target_id is None or cost < best[target_id]):
+                        best[stop] = cost
+                        current[stop] = cost
+                        round_parents[stop] = (route_stops[board_position], route_index, board_position, position)
+                        marked.add(stop)
+                    if previous[stop] - position < boarded:
+                        boarded = previous[stop] - position
+                        board_position = position
+                if whole:
+                    # Boarding inside the segment gives the same leaving cost on every route through it;
+                    # if nobody boarded there, that cost is only looked up when another route needs it
+                    if board_position > segment_start:
+                        scanned_segments[segment_id] = (entry, boarded + segment_end, board_position - segment_start)
+                    else:
+                        scanned_segments[segment_id] = (entry, None, None)
+
+        labels.append(current)
+        parents.append(round_parents)
+
+        if stats is not None:
+            stats['rounds'] = stats.get('rounds', 0) + 1
+            stats['routes_scanned'] = stats.get('routes_scanned', 0) + len(scan_from)
+            stats['expanded'] = stats.get('expanded', 0) + len(round_parents)
+            stats['queue_peak'] = max(stats.get('queue_peak', 0), len(marked))
+
+    if stats is not None:
+        stats['segments_skipped'] = stats.get('segments_skipped', 0) + segments_skipped
+    return labels, parents
+
+
+# Shorter shared segments are cheaper to scan stop by stop than to look up and skip
+CORRIDOR_MIN_STOPS = 8
+
+
+def _segment_boarding(entry, labels, route_stops, segment_start, segment_end):
+    """
+    Найменша вартість виїзду з відрізка при посадці на одній з його зупинок (крім першої)
+
+    entry - вартість на початку відрізка, з якою його було проскановано
+    labels - мітки зупинок попереднього кроку
+    route_stops - зупинки напрямку, що містить відрізок
+    segment_start - позиція початку відрізка на напрямку
+    segment_end - позиція кінця відрізка на напрямку
+    повертає: кортеж (entry, вартість на кінці відрізка, зміщення найранішої зупинки посадки з такою вартістю)
+    """
+    leave_cost = float('inf')
+    leave_offset = None
+    for position in range(segment_start + 1, segment_end + 1):
+        cost = labels[route_stops[position]] + segment_end - position
+        if cost < leave_cost:
+            leave_cost = cost
+            leave_offset = position - segment_start
+    return entry, leave_cost, leave_offset
+
+
+def get_corridors(index):
+    """
+    Отримання частин напрямків, якими їх проходить _run_rounds, з позначеними спільними коридорами
+
+    Напрямок розбивається на відрізки на зупинках, де до нього приєднуються або від нього відходять
+    інші напрямки. Відрізок, яким їдуть кілька напрямків і який має щонайменше CORRIDOR_MIN_STOPS
+    перегонів, - спільний коридор: він отримує номер, однаковий для всіх цих напрямків, і _run_rounds
+    може пропустити його цілком. Решта сусідніх відрізків об'єднується в одну частину.
+    Зупинки напрямків і далі зберігаються лише в Route (direct_ids, reverse_ids), тож у індексі
+    лишаються тільки межі частин.
+
+    index - індекс мережі
+    повертає: для кожного напрямку список кортежів (номер коридору або -1, позиція початку, позиція кінця)
+    """
+    if index['corridors'] is None:
+        routes = index['routes']
+        edge_routes = {}
+        for route_index, (_, _, route_stops) in enumerate(routes):
+            for edge in zip(route_stops, route_stops[1:]):
+                edge_routes.setdefault(edge, set()).add(route_index)
+
+        # Stops of each segment, only needed to give the same segment of different directions the same number
+        segment_ids = {}
+        route_pieces = []
+        for route_index, (_, _, route_stops) in enumerate(routes):
+            pieces = []
+            start = 0
+            for position in range(1, len(route_stops)):
+                if (position < len(route_stops) - 1
+                        and edge_routes[route_stops[position - 1], route_stops[position]]
+                        == edge_routes[route_stops[position], route_stops[position + 1]]):
+                    continue
+                edge = route_stops[position - 1], route_stops[position]
+                if len(edge_routes[edge]) > 1 and position - start >= CORRIDOR_MIN_STOPS:
+                    segment_id = segment_ids.setdefault(tuple(route_stops[start:position + 1]), len(segment_ids))
+                    pieces.append((segment_id, start, position))
+                elif pieces and pieces[-1][0] < 0:
+                    pieces[-1] = (-1, pieces[-1][1], position)
+                else:
+                    pieces.append((-1, start, position))
+                start = position
+            route_pieces.append(pieces or [(-1, 0, 0)])
+        index['corridors'] = route_pieces
+    return index['corridors']
+
+
+def _build_journey(index, parents, stop_id, round_number):
+    """
+    Відновлення маршруту, знайденого на заданому кроці RAPTOR
 
-    file_path - шлях до файлу з інформацією про трамвайні маршрути
-    повертає: словник з інформацією про трамвайні маршрути
+    index - індекс мережі
+    parents - словники попередніх зупинок для кожного кроку
+    stop_id - ідентифікатор кінцевої зупинки
+    round_number - крок, на якому було досягнуто кінцеву зупинку
+    повертає: список кортежів (номер трамваю, список зупинок, кількість зупинок)
     """
-    trams = {}
+    stop_names = index['stop_names']
+    journey = []
+    while round_number > 0:
+        # The label valid at this round was set on the latest round that improved the stop
+        if stop_id not in parents[round_number]:
+            round_number -= 1
+            continue
+        previous_stop, route_index, board_position, alight_position = parents[round_number][stop_id]
+        tram, _, route_stops = index['routes'][route_index]
+        stops = [stop_names[stop] for stop in route_stops[board_position:alight_position + 1]]
+        journey.append((tram, stops, alight_position - board_position))
+        stop_id = previous_stop
+        round_number -= 1
+    journey.reverse()
+    return journey
 
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
 
-    current_tram = None
-    current_route_name = None
-    direct_route = []
-    reverse_route = []
+def get_transfer_graph(index):
+    """
+    Отримання графа пересадок між напрямками маршрутів трамваїв
 
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
+    Вершини графа - напрямки маршрутів (індекси routes індексу мережі), ребро між двома напрямками
+    містить усі їх спільні зупинки, на яких можна пересісти з одного напрямку на інший. Напрямок,
+    що проходить через зупинку двічі, має ребро сам до себе: пересадку на нього ж на іншій позиції.
 
-        # Detect new tram number
-        if line and line[0].isdigit():
-            if current_tram:
-                # Save previous tram route before processing new tram
-                trams[current_tram] = [current_route_name, direct_route, reverse_route,
-                                       set(direct_route + reverse_route)]
-
-            # Parse tram number
-            current_tram = int(line.strip())
-            i += 1
-            current_route_name = lines[i].strip()
-            direct_route = []
-            reverse_route = []
+    index - індекс мережі
+    повертає: для кожного напрямку список кортежів (індекс іншого напрямку, посортовані позиції спільних
+              зупинок на цьому напрямку, найраніша позиція на іншому напрямку серед зупинок, починаючи з i-ї,
+              найпізніша позиція на іншому напрямку серед зупинок до i-ї включно, ідентифікатори зупинок)
+    """
+    if index['transfer_graph'] is None:
+        shared = [{} for _ in index['routes']]
+        for stop_id, occurrences in enumerate(index['stop_routes']):
+            for route_index, position in occurrences:
+                for other_route, other_position in occurrences:
+                    # A direction that passes a stop twice can be boarded again at its other occurrence
+                    if other_route != route_index or other_position != position:
+                        shared[route_index].setdefault(other_route, []).append((position, other_position, stop_id))
+
+        graph = []
+        for transfers in shared:
+            edges = []
+            for other_route, stops in transfers.items():
+                stops.sort()
+                earliest_after = [other_position for _, other_position, _ in stops]
+                for i in range(len(stops) - 2, -1, -1):
+                    earliest_after[i] = min(earliest_after[i], earliest_after[i + 1])
+                latest_before = list(itertools.accumulate((other_position for _, other_position, _ in stops), max))
+                edges.append((other_route, [position for position, _, _ in stops], earliest_after, latest_before,
+                              [stop_id for _, _, stop_id in stops]))
+            graph.append(edges)
+        index['transfer_graph'] = graph
+    return index['transfer_graph']
+
+
+def min_transfers(tram_routes, start_stop, end_stop):
+    """
+    Найменша кількість пересадок між двома зупинками (пошук лише на графі пересадок між трамваями)
 
-        # Parse the direct route
-        elif "Прямий напрямок:" in line:
-            direct_route = line.split("Прямий напрямок:")[1].split(" - ")
+    tram_routes - словник з інформацією про трамвайні маршрути
+    start_stop - назва початкової зупинки
+    end_stop - назва кінцевої зупинки
+    повертає: кількість пересадок або None, якщо маршрут не знайдено
+    """
+    index = get_network_index(tram_routes)
+    start_id = _served_stop_id(index, start_stop)
+    end_id = _served_stop_id(index, end_stop)
+    if start_id is None or end_id is None:
+        return None
+    if start_stop == end_stop:
+        return 0
+    levels = _transfer_levels(index, start_id, end_id)
+    return len(levels) - 1 if levels else None
+
+
+def _transfer_levels(index, source_id, target_id=None, forward=True):
+    """
+    Пошук у ширину на графі пересадок від зупинки
+
+    Рівень k - напрямки, на які можна сісти після k пересадок, з найранішою позицією посадки
+    (для пошуку назад - з найпізнішою позицією, до якої треба зійти, щоб дістатися зупинки source_id)
+    та напрямком попереднього рівня, з якого на нього пересіли. Якщо задано target_id, пошук
+    зупиняється на першому рівні, з якого досяжна ця зупинка, і в цьому рівні лишаються лише напрямки,
+    що до неї довозять; інакше пошук обходить усі досяжні напрямки.
+
+    index - індекс мережі
+    source_id - ідентифікатор зупинки, від якої ведеться пошук
+    target_id - ідентифікатор зупинки на іншому кінці маршруту або None
+    forward - True для пошуку від початкової зупинки маршруту, False - назад від кінцевої
+    повертає: список рівнів (словників кортежів (позиція, попередній напрямок або None) за індексом напрямку);
+              None, якщо зупинка target_id недосяжна
+    """
+    graph = get_transfer_graph(index)
+    stop_routes = index['stop_routes']
+
+    # The earliest boarding (or latest alighting, backwards) position is the best one
+    better = (lambda a, b: a < b) if forward else (lambda a, b: a > b)
+    best = {}
+    for route_index, position in stop_routes[source_id]:
+        if route_index not in best or better(position, best[route_index]):
+            best[route_index] = position
+    target_positions = {}
+    if target_id is not None:
+        for route_index, position in stop_routes[target_id]:
+            if route_index not in target_positions or better(target_positions[route_index], position):
+                target_positions[route_index] = position
+
+    level = {route_index: (position, None) for route_index, position in best.items()}
+    levels = [level]
+    while level:
+        reached = {route_index: entry for route_index, entry in level.items()
+                   if route_index in target_positions and better(entry[0], target_positions[route_index])}
+        if reached:
+            levels[-1] = reached
+            return levels
+
+        next_level = {}
+        for route_index, (position, _) in level.items():
+            for other_route, positions, earliest_after, latest_before, _ in graph[route_index]:
+                # Transfers happen after boarding (before alighting, backwards) on this direction
+                if forward:
+                    first = bisect.bisect_right(positions, position)
+                    if first == len(positions):
+                        continue
+                    other_position = earliest_after[first]
+                else:
+                    last = bisect.bisect_left(positions, position)
+                    if last == 0:
+                        continue
+                    other_position = latest_before[last - 1]
+                if other_route not in best or better(other_position, best[other_route]):
+                    best[other_route] = other_position
+                    next_level[other_route] = (other_position, route_index)
+        level = next_level
+        if level:
+            levels.append(level)
+    return None if target_id is not None else levels
+
+
+def _transfer_trams(index, start_id, end_id):
+    """
+    Трамваї маршруту з найменшою кількістю пересадок, знайдені лише на графі пересадок
 
-        # Parse the reverse route
-        elif "Зворотній напрямок:" in line:
-            reverse_route = line.split("Зворотній напрямок:")[1].split(" - ")
+    index - індекс мережі
+    start_id - ідентифікатор початкової зупинки
+    end_id - ідентифікатор кінцевої зупинки
+    повертає: список номерів трамваїв у порядку поїздки або None, якщо маршрут не знайдено
+    """
+    levels = _transfer_levels(index, start_id, end_id)
+    if not levels:
+        return None
+    route_index = min(levels[-1])
+    route_path = []
+    for level in reversed(levels):
+        route_path.append(route_index)
+        route_index = level[route_index][1]
+    routes = index['routes']
+    return [routes[route_index][0] for route_index in reversed(route_path)]
+
+
+def _reachable_routes(index, stop_id, forward=True):
+    """
+    Напрямки, на які можна потрапити із зупинки (або з яких можна дістатися зупинки, якщо не forward)
 
-        i += 1
+    Результат зберігається в індексі мережі, тож граф обходиться не більше двох разів для кожної зупинки.
 
-    # Save the last tram's route
-    if current_tram:
-        trams[current_tram] = [current_route_name, direct_route, reverse_route, set(direct_route + reverse_route)]
+    index - індекс мережі
+    stop_id - ідентифікатор зупинки
+    forward - True для зупинки початку маршруту, False - для зупинки його кінця
+    повертає: frozenset індексів напрямків
+    """
+    reach = index['route_reach']
+    if reach is None:
+        reach = index['route_reach'] = {}
+    key = (stop_id, forward)
+    routes = reach.get(key)
+    if routes is None:
+        routes = reach[key] = frozenset().union(*_transfer_levels(index, stop_id, forward=forward))
+    return routes
 
-    return trams
 
+def _useful_routes(index, start_id, end_id):
+    """
+    Напрямки, які можуть входити до маршруту між двома зупинками (за графом пересадок)
+
+    Напрямок корисний, якщо на нього можна потрапити з початкової зупинки і з нього можна дістатися
+    кінцевої. Решту напрямків пошук RAPTOR може не сканувати: вони не змінюють мітки зупинок,
+    з яких досяжна кінцева зупинка.
 
-trams = process_tram_file('TramsInfo.txt')
+    index - індекс мережі
+    start_id - ідентифікатор початкової зупинки
+    end_id - ідентифікатор кінцевої зупинки
+    повертає: множина індексів напрямків (порожня, якщо маршрут не знайдено)
+    """
+    return _reachable_routes(index, start_id) & _reachable_routes(index, end_id, forward=False)
 
 
-def find_trams_by_stop(tram_routes, stop_name):
+# Label of a stop not reached by the vectorised sweep, and the per-route offset that keeps
+# a running minimum from leaking into the next route of the flat array (both fit in int64)
+_SWEEP_UNREACHED = 1 << 31
+_SWEEP_ROUTE_OFFSET = 1 << 32
+
+
+def get_route_arrays(index):
     """
-        Пошук трамваїв, які зупиняються на заданій зупинці
+    Отримання CSR-представлення напрямків маршрутів для векторизованих обчислень NumPy
+
+    index - індекс мережі
+    повертає: словник масивів NumPy:
+        route_offsets - межі напрямків: напрямок r займає елементи route_offsets[r]:route_offsets[r + 1]
+        route_stops - ідентифікатори зупинок усіх напрямків підряд
+        positions - позиція кожного елемента route_stops на його напрямку
+        element_routes - індекс напрямку кожного елемента route_stops
+    """
+    import numpy as np
+
+    if index['route_arrays'] is None:
+        lengths = np.array([len(route_stops) for _, _, route_stops in index['routes']], dtype=np.int64)
+        route_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=route_offsets[1:])
+        element_routes = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        index['route_arrays'] = {
+            'route_offsets': route_offsets,
+            'route_stops': np.array([stop for _, _, route_stops in index['routes'] for stop in route_stops],
+                                    dtype=np.int64),
+            'positions': np.arange(route_offsets[-1], dtype=np.int64) - route_offsets[element_routes],
+            'element_routes': element_routes,
+        }
+    return index['route_arrays']
+
+
+def _sweep_rounds(index, start_id, max_rounds=None):
+    """
+    Векторизовані кроки RAPTOR від початкової зупинки до всіх зупинок мережі
 
-        tram_routes - словник з інформацією про трамвайні маршрути
-        stop_name - назва зупинки
-        повертає: список номерів трамваїв, які зупиняються на заданій зупинці
-        """
-    trams = []
-    for tram, routes in tram_routes.items():
-        if stop_name in routes[1] or stop_name in routes[2]:
-            trams.append(tram)
-    return trams
+    На кожному кроці скануються одразу всі напрямки, що проходять через покращені на попередньому
+    кроці зупинки: найкраща точка посадки - це біжучий мінімум (мітка зупинки - позиція) вздовж напрямку.
+
+    index - індекс мережі
+    start_id - ідентифікатор початкової зупинки
+    max_rounds - найбільша кількість кроків (трамваїв у маршруті), None - поки є покращення
+    повертає: масив int64 [кроки + 1, кількість зупинок] - найменша кількість зупинок до кожної зупинки
+              з використанням не більше k трамваїв (_SWEEP_UNREACHED - недосяжна)
+    """
+    import numpy as np
 
+    arrays = get_route_arrays(index)
+    route_stops = arrays['route_stops']
+    element_routes = arrays['element_routes']
 
-def find_best_route(tram_routes, start_stop, end_stop):
+    labels = np.full(len(index['stop_names']), _SWEEP_UNREACHED, dtype=np.int64)
+    labels[start_id] = 0
+    rounds = [labels]
+    frontier = np.zeros(len(labels), dtype=bool)
+    frontier[start_id] = True
+
+    while frontier.any() and (max_rounds is None or len(rounds) <= max_rounds):
+        previous = rounds[-1]
+        # Only routes through a stop improved on the previous round can improve anything
+        active_routes = np.zeros(len(arrays['route_offsets']) - 1, dtype=bool)
+        active_routes[element_routes[frontier[route_stops]]] = True
+        elements = np.flatnonzero(active_routes[element_routes])
+
+        stops = route_stops[elements]
+        positions = arrays['positions'][elements]
+        offsets = element_routes[elements] * _SWEEP_ROUTE_OFFSET
+        boarded = np.minimum.accumulate(previous[stops] - positions - offsets)
+        ride = np.minimum(boarded + offsets + positions, _SWEEP_UNREACHED)
+
+        current = previous.copy()
+        np.minimum.at(current, stops, ride)
+        frontier = current < previous
+        rounds.append(current)
+
+    return np.array(rounds)
+
+
+def reachable_stops(tram_routes, start_stop, max_stops=None, max_transfers=None):
     """
-        Пошук найкращого маршруту між двома зупинками
+    Пошук усіх зупинок, до яких можна дістатися від початкової зупинки, за один векторизований прохід
 
-        tram_routes - словник з інформацією про трамвайні маршрути
-        start_stop - назва початкової зупинки
-        end_stop - назва кінцевої зупинки
-        повертає: список кортежів з інформацією про маршрут (номер трамваю, список зупинок, кількість зупинок)
-        """
-    queue = deque([(start_stop, [], 0)])  # (current_stop, path, transfers)
-    visited = set()
+    tram_routes - словник з інформацією про трамвайні маршрути
+    start_stop - назва початкової зупинки
+    max_stops - найбільша кількість зупинок (None - без обмежень)
+    max_transfers - найбільша кількість пересадок (None - без обмежень)
+    повертає: словник за назвою зупинки (без початкової) з кортежами (найменша кількість зупинок
+              з не більше ніж max_transfers пересадками, найменша кількість пересадок з не більше ніж
+              max_stops зупинками); порожній словник, якщо зупинки немає
+    """
+    import numpy as np
+
+    index = get_network_index(tram_routes)
+    start_id = _served_stop_id(index, start_stop)
+    if start_id is None:
+        return {}
+
+    with metrics.stage('search.reachability'):
+        max_rounds = None if max_transfers is None else max_transfers + 1
+        rounds = _sweep_rounds(index, start_id, max_rounds)[1:]
+        stop_limit = _SWEEP_UNREACHED - 1 if max_stops is None else max_stops
+        within_limit = rounds <= stop_limit
+        reached = within_limit.any(axis=0)
+        reached[start_id] = False
+
+        stop_ids = np.flatnonzero(reached)
+        min_stops = rounds[-1][stop_ids].tolist()
+        min_transfers = within_limit[:, stop_ids].argmax(axis=0).tolist()
+
+    stop_names = index['stop_names']
+    return {stop_names[stop_id]: (stops, transfers)
+            for stop_id, stops, transfers in zip(stop_ids.tolist(), min_stops, min_transfers)}
+
+
+# Number of journeys (the best one and its alternatives) suggested for a route query
+ROUTE_ALTERNATIVES = 3
 
-    while queue:
-        current_stop, path, transfers = queue.popleft()
 
-        if current_stop == end_stop:
-            return path
+def plan_alternatives(tram_routes, start_stop, end_stop, count=ROUTE_ALTERNATIVES):
+    """
+    Пошук кількох різних маршрутів між двома зупинками
+
+    Першим завжди є найкращий маршрут (див. find_best_route), далі - маршрути іншими трамваями
+    чи з пересадками на інших зупинках, впорядковані за кількістю пересадок, а потім за кількістю зупинок.
+    Варіанти отримуються з міток того самого пошуку RAPTOR, що й plan_journeys: останній трамвай
+    варіанта - один з маршрутів через кінцеву зупинку, на який сідають на будь-якій зупинці,
+    покращеній на попередньому кроці, а частина до неї відновлюється з міток цього кроку.
+    Варіант відкидається, якщо вже вибраний маршрут лише з його трамваїв і його зупинок пересадки
+    має не більше пересадок і зупинок.
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    start_stop - назва початкової зупинки
+    end_stop - назва кінцевої зупинки
+    count - найбільша кількість маршрутів у результаті
+    повертає: список маршрутів у форматі find_best_route; порожній список, якщо маршрут не знайдено
+    """
+    if count <= 1:
+        return plan_journeys(tram_routes, start_stop, end_stop)[:count]
+
+    index = get_network_index(tram_routes)
+    start_id = _served_stop_id(index, start_stop)
+    end_id = _served_stop_id(index, end_stop)
+    if start_id is None or end_id is None:
+        return []
+
+    cache_key = (start_stop, end_stop, 'alternatives', count)
+    alternatives = journey_cache.get(index['version'], cache_key)
+    if alternatives is None:
+        # One search gives both the best journeys (cached for plan_journeys) and the alternatives
+        search_state = {}
+        best_journeys = _search_journeys(index, start_stop, end_stop, start_id, end_id, None, search_state)
+        with metrics.stage('search.alternatives'):
+            alternatives = _plan_alternatives(index, start_id, end_id, best_journeys, search_state, count)
+        journey_cache.put(index['version'], cache_key, alternatives)
+    return alternatives
+
+
+def _plan_alternatives(index, start_id, end_id, best_journeys, search_state, count):
+    """
+    Пошук різних маршрутів за ідентифікаторами зупинок, див. plan_alternatives
 
-        if (current_stop, transfers) in visited:
+    best_journeys - результат plan_journeys для цієї пари зупинок
+    search_state - стан пошуку, з якого отримано best_journeys (див. _plan_journeys)
+    """
+    if not search_state or not best_journeys:
+        # The same stop, or no journey at all
+        return best_journeys[:1]
+
+    labels, parents = search_state['labels'], search_state['parents']
+    routes = index['routes']
+    stop_names = index['stop_names']
+
+    # Boarding the last tram at every stop improved on the previous round, with the prefix to that stop
+    # from the same labels. Candidates are keyed by their trams and transfer stops, so each is kept once,
+    # and their journeys are only built when they are looked at.
+    prefix_keys = {}
+
+    def prefix_key(stop, round_number):
+        while round_number > 0 and stop not in parents[round_number]:
+            round_number -= 1
+        if round_number == 0:
+            return ()
+        key = prefix_keys.get((stop, round_number))
+        if key is None:
+            previous_stop, route_index, _, _ = parents[round_number][stop]
+            key = prefix_keys[stop, round_number] = (prefix_key(previous_stop, round_number - 1)
+                                                     + ((routes[route_index][0], stop_names[previous_stop]),))
+        return key
+
+    candidates = {}
+    for route_index, end_position in index['stop_routes'][end_id]:
+        tram = routes[route_index][0]
+        route_stops = routes[route_index][2]
+        for round_number in range(1, len(labels)):
+            improved = parents[round_number - 1] if round_number > 1 else (start_id,)
+            previous = labels[round_number - 1]
+            for position in range(end_position):
+                stop = route_stops[position]
+                if stop not in improved:
+                    continue
+                key = prefix_key(stop, round_number - 1) + ((tram, stop_names[stop]),)
+                if key not in candidates:
+                    candidates[key] = (len(key), previous[stop] + end_position - position,
+                                       stop, round_number, route_index, position, end_position)
+
+    end_name = stop_names[end_id]
+    best_journey = best_journeys[0]
+    journeys = [best_journey]
+    accepted = [(frozenset(tram for tram, _, _ in best_journey),
+                 frozenset(stops[0] for _, stops, _ in best_journey[1:]),
+                 len(best_journey), sum(count for _, _, count in best_journey))]
+    for key, (legs, stops, stop, round_number, route_index, position, end_position) in sorted(
+            candidates.items(), key=lambda candidate: candidate[1][:2]):
+        trams = [leg_tram for leg_tram, _ in key]
+        if any(first == second for first, second in zip(trams, trams[1:])):
+            continue
+        prefix = _build_journey(index, parents, stop, round_number - 1)
+        if any(end_name in leg_stops for _, leg_stops, _ in prefix):
+            # Passes the end stop on an earlier tram
             continue
+        tram_set = frozenset(trams)
+        transfer_stops = frozenset(transfer_stop for _, transfer_stop in key[1:])
+        if any(other_trams <= tram_set and other_transfers <= transfer_stops and other_legs <= legs
+               and other_stops <= stops for other_trams, other_transfers, other_legs, other_stops in accepted):
+            continue
+        accepted.append((tram_set, transfer_stops, legs, stops))
+        route_stops = routes[route_index][2]
+        journeys.append(prefix + [(trams[-1], [stop_names[stop] for stop in route_stops[position:end_position + 1]],
+                                   end_position - position)])
+        if len(journeys) == count:
+            break
+    return journeys
 
-        visited.add((current_stop, transfers))
 
-        for tram, routes in tram_routes.items():
-            for direction in [1, 2]:
-                if current_stop in routes[direction]:
-                    start_index = routes[direction].index(current_stop)
-                    for next_stop in routes[direction][start_index:]:
-                        if next_stop == end_stop:
-                            return path + [(tram, routes[direction][start_index:routes[direction].index(next_stop) + 1],
-                                            routes[direction].index(next_stop) - start_index)]
-                        if (next_stop, transfers + 1) not in visited:
-                            queue.append((next_stop, path + [(tram, routes[direction][
-                                                                    start_index:routes[direction].index(next_stop) + 1],
-                                                              routes[direction].index(next_stop) - start_index)],
-                                          transfers + 1))
+# Minimum time (minutes) to change from one tram to another at a stop
+TRANSFER_MINUTES = 1
 
-    return None
 
+def build_connections(tram_routes):
+    """
+    Побудова з'єднань (рухів рейсу між сусідніми зупинками) для всіх рейсів за розкладом
 
-def create_route_text(tram_routes, start_stop, end_stop):
-    route = find_best_route(tram_routes, start_stop, end_stop)
-    if not route:
-        return "Маршрут не знайдено. Перевірте коректність введених назв зупинок."
+    Для маршрутів без розкладу використовуються типові значення (DEFAULT_SEGMENT_MINUTES,
+    DEFAULT_HEADWAY_MINUTES, DEFAULT_SERVICE_HOURS).
 
-    route_text = []
-    for i, (tram, stops, count) in enumerate(route):
-        if count == 1:
-            stop_text = "проїдьте 1 зупинку"
-        elif count in [2, 3, 4]:
-            stop_text = f"проїдьте {count} зупинки"
-        else:
-            stop_text = f"проїдьте {count} зупинок"
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: словник списків, посортованих за часом відправлення:
+        departures, arrivals - час відправлення та прибуття з'єднання у хвилинах від півночі
+        from_stops, to_stops - ідентифікатори зупинок відправлення та прибуття
+        trips - номер рейсу, до якого належить з'єднання
+        positions - позиція зупинки відправлення на маршруті рейсу
+        trip_routes - для кожного рейсу індекс маршруту у routes індексу мережі
+    """
+    import numpy as np
 
-        if i == 0:
-            route_text.append(f"Скористайтеся трамваєм №{tram}, {stop_text}: " + " - ".join(stops))
-        else:
-            route_text.append(f"\nПересядьте на трамвай №{tram}, {stop_text}: " + " - ".join(stops))
+    index = get_network_index(tram_routes)
+    columns = {key: [] for key in ('departures', 'arrivals', 'from_stops', 'to_stops', 'trips', 'positions')}
+    trip_routes = []
+
+    for route_index, (tram, direction, route_stops) in enumerate(index['routes']):
+        segments = len(route_stops) - 1
+        if segments < 1:
+            continue
+        route = tram_routes[tram]
+        timetable = route.timetable or make_timetable(len(route.direct_ids), len(route.reverse_ids))
+        minutes = timetable['direct_minutes'] if direction == 1 else timetable['reverse_minutes']
+        offsets = np.concatenate(([0], np.cumsum(minutes)))
+        headway, first, last = timetable_schedule(timetable, direction)
+        starts = np.arange(first, last + 1, headway)
+        stops = np.asarray(route_stops)
+
+        # One row per trip, one column per segment
+        columns['departures'].append((starts[:, None] + offsets[None, :-1]).ravel())
+        columns['arrivals'].append((starts[:, None] + offsets[None, 1:]).ravel())
+        columns['from_stops'].append(np.tile(stops[:-1], len(starts)))
+        columns['to_stops'].append(np.tile(stops[1:], len(starts)))
+        columns['trips'].append(np.repeat(np.arange(len(trip_routes), len(trip_routes) + len(starts)), segments))
+        columns['positions'].append(np.tile(np.arange(segments), len(starts)))
+        trip_routes.extend([route_index] * len(starts))
+
+    columns = {key: np.concatenate(parts) if parts else np.zeros(0, dtype=int) for key, parts in columns.items()}
+    order = np.lexsort((columns['arrivals'], columns['departures']))
+    # The scan loop runs in Python, where plain lists index faster than NumPy arrays
+    connections = {key: column[order].tolist() for key, column in columns.items()}
+    connections['trip_routes'] = trip_routes
+    return connections
+
+
+def get_connections(tram_routes):
+    """
+    Отримання з'єднань за розкладом, що будуються один раз для версії даних
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: з'єднання, див. build_connections
+    """
+    index = get_network_index(tram_routes)
+    if index['connections'] is None:
+        with metrics.stage('connections.build'):
+            index['connections'] = build_connections(tram_routes)
+    return index['connections']
+
+
+def earliest_arrival(tram_routes, start_stop, end_stop, departure):
+    """
+    Пошук поїздки з найранішим прибуттям за розкладом (алгоритм сканування з'єднань)
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    start_stop - назва початкової зупинки
+    end_stop - назва кінцевої зупинки
+    departure - час, з якого пасажир чекає на зупинці, у хвилинах від півночі
+    повертає: словник поїздки (departure, arrival - час відправлення та прибуття у хвилинах від півночі,
+              legs - список кортежів (номер трамваю, список зупинок, час посадки, час прибуття),
+              estimated - номери трамваїв поїздки без розкладу, час яких обчислено за типовими значеннями)
+              або None, якщо зупинок немає чи після цього часу вже не доїхати
+    """
+    index = get_network_index(tram_routes)
+    start_id = _served_stop_id(index, start_stop)
+    end_id = _served_stop_id(index, end_stop)
+    if start_id is None or end_id is None:
+        return None
+    if start_stop == end_stop:
+        return {'departure': departure, 'arrival': departure, 'legs': [], 'estimated': []}
+
+    connections = get_connections(tram_routes)
+    with metrics.stage('arrival.search'):
+        journey = _scan_connections(index, connections, start_id, end_id, departure)
+    if journey is not None:
+        journey['estimated'] = sorted({tram for tram, _, _, _ in journey['legs']
+                                       if tram_routes[tram].timetable is None})
+    return journey
+
+
+def _scan_connections(index, connections, start_id, end_id, departure):
+    """
+    Сканування з'єднань за зростанням часу відправлення, див. earliest_arrival
+    """
+    departures = connections['departures']
+    arrivals = connections['arrivals']
+    from_stops = connections['from_stops']
+    to_stops = connections['to_stops']
+    trips = connections['trips']
+
+    unreached = float('inf')
+    # Earliest arrival at each stop and the earliest time a tram can be boarded there
+    earliest = [unreached] * len(index['stop_names'])
+    ready = [unreached] * len(index['stop_names'])
+    earliest[start_id] = ready[start_id] = departure
+    # trip -> connection it is boarded at; stop -> (connection that reached it, connection its trip was boarded at)
+    boarded = {}
+    reached_by = {}
+
+    first = bisect.bisect_left(departures, departure)
+    scanned = 0
+    for connection in range(first, len(departures)):
+        connection_departure = departures[connection]
+        if connection_departure >= earliest[end_id]:
+            break
+        scanned += 1
+        trip = trips[connection]
+        if ready[from_stops[connection]] <= connection_departure:
+            # Board as late as possible: a trip that could also have been boarded earlier on
+            # its route would otherwise make the journey ride past the transfer stop and back
+            boarded[trip] = connection
+        elif trip not in boarded:
+            continue
+
+        stop = to_stops[connection]
+        if arrivals[connection] < earliest[stop]:
+            earliest[stop] = arrivals[connection]
+            ready[stop] = arrivals[connection] + TRANSFER_MINUTES
+            reached_by[stop] = (connection, boarded[trip])
+    metrics.count('arrival.scanned', scanned)
+
+    if earliest[end_id] == unreached:
+        return None
+
+    stop_names = index['stop_names']
+    legs = []
+    stop = end_id
+    while stop != start_id:
+        alight, board = reached_by[stop]
+        tram, _, route_stops = index['routes'][connections['trip_routes'][trips[alight]]]
+        stops = [stop_names[stop_id]
+                 for stop_id in route_stops[connections['positions'][board]:connections['positions'][alight] + 2]]
+        legs.append((tram, stops, departures[board], arrivals[alight]))
+        stop = from_stops[board]
+    legs.reverse()
+    return {'departure': legs[0][2], 'arrival': earliest[end_id], 'legs': legs}
+
+
+def create_arrival_text(tram_routes, start_stop, end_stop, departure):
+    """
+    Опис поїздки з найранішим прибуттям за розкладом
 
-    return ". ".join(route_text)
+    tram_routes - словник з інформацією про трамвайні маршрути
+    start_stop - назва початкової зупинки
+    end_stop - назва кінцевої зупинки
+    departure - час, з якого пасажир чекає на зупинці, у хвилинах від півночі
+    повертає: текст з часом посадки, пересадок та прибуття; якщо розкладу деяких трамваїв немає,
+              текст починається з попередження, що час орієнтовний
+    """
+    journey = earliest_arrival(tram_routes, start_stop, end_stop, departure)
+    if journey is None:
+        if is_known_stop(tram_routes, start_stop) and is_known_stop(tram_routes, end_stop):
+            text = f"Після {format_clock(departure)} трамваї цим маршрутом вже не курсують."
+            if any(route.timetable is None for route in tram_routes.values()):
+                text += "\n" + _estimate_note() + "."
+            return text
+        return "Маршрут не знайдено. Перевірте коректність введених назв зупинок."
+    if not journey['legs']:
+        return "Ви вже на місці."
+
+    journey_text = []
+    if journey['estimated']:
+        trams = ", ".join(f"№{tram}" for tram in journey['estimated'])
+        journey_text.append(f"Розкладу трамваїв {trams} немає, тож час орієнтовний. " + _estimate_note())
+    for i, (tram, stops, board_time, alight_time) in enumerate(journey['legs']):
+        action = "Сядьте" if i == 0 else "Пересядьте"
+        journey_text.append(f"{action} о {format_clock(board_time)} на трамвай №{tram}: " + " - ".join(stops)
+                            + f" (прибуття о {format_clock(alight_time)})")
+    approximately = "орієнтовно " if journey['estimated'] else ""
+    journey_text.append(f"Ви будете на місці {approximately}о {format_clock(journey['arrival'])}, "
+                        f"у дорозі {journey['arrival'] - departure} хв.")
+    return ".\n".join(journey_text)
+
+
+def _estimate_note():
+    first, last = DEFAULT_SERVICE_HOURS
+    return (f"Для маршрутів без розкладу прийнято {DEFAULT_SEGMENT_MINUTES} хв між зупинками, "
+            f"інтервал {DEFAULT_HEADWAY_MINUTES} хв і рух з {format_clock(first)} до {format_clock(last)}")
+
+
+def create_route_text(tram_routes, start_stop, end_stop, alternatives=ROUTE_ALTERNATIVES):
+    journeys = plan_alternatives(tram_routes, start_stop, end_stop, alternatives)
+    if not journeys:
+        return "Маршрут не знайдено. Перевірте коректність введених назв зупинок."
+    route = journeys[0]
+
+    with metrics.stage('route.format'):
+        route_text = []
+        for i, (tram, stops, count) in enumerate(route):
+            if count == 1:
+                stop_text = "проїдьте 1 зупинку"
+            elif count in [2, 3, 4]:
+                stop_text = f"проїдьте {count} зупинки"
+            else:
+                stop_text = f"проїдьте {count} зупинок"
+
+            if i == 0:
+                route_text.append(f"Скористайтеся трамваєм №{tram}, {stop_text}: " + " - ".join(stops))
+            else:
+                route_text.append(f"\nПересядьте на трамвай №{tram}, {stop_text}: " + " - ".join(stops))
+
+        alternative_text = []
+        for journey in journeys[1:]:
+            legs = ", далі ".join(f"трамвай №{tram} ({stops[0]} - {stops[-1]})" for tram, stops, _ in journey)
+            total = sum(count for _, _, count in journey)
+            alternative_text.append(f"\n\nІнший варіант: {legs}; зупинок: {total}, пересадок: {len(journey) - 1}.")
+
+        return ". ".join(route_text) + "".join(alternative_text)
+
+
+UKRAINIAN_ALPHABET = 'абвгґдеєжзиіїйклмнопрстуфхцчшщьюя'
+LATIN_ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+# Primary collation weight of each letter and digit (1 byte): digits, then the Ukrainian
+# alphabet, then Latin. Characters without a weight (spaces, punctuation) are ignored at the
+# primary level and only break ties.
+_COLLATION_WEIGHTS = {char: weight for weight, char in enumerate('0123456789' + UKRAINIAN_ALPHABET
+                                                                 + LATIN_ALPHABET, start=1)}
+# Weight of letters outside both alphabets, sorted after all known letters
+_COLLATION_OTHER_LETTER = 0xF0
+
+
+def collation_key(text):
+    """
+    Обчислення ключа сортування рядка за українським алфавітом
+
+    Рядки порівнюються спершу за літерами та цифрами без урахування регістру, потім за регістром,
+    а далі за повним текстом з пробілами та розділовими знаками, тож різні назви не бувають рівними.
+
+    text - рядок для сортування
+    повертає: ключ сортування (bytes)
+    """
+    primary = bytearray()
+    case = bytearray()
+    for char in text:
+        lower = char.lower()
+        weight = _COLLATION_WEIGHTS.get(lower)
+        if weight is None:
+            if not char.isalpha():
+                continue
+            weight = _COLLATION_OTHER_LETTER
+        primary.append(weight)
+        case.append(char != lower)
+    return bytes(primary) + b'\0' + bytes(case) + b'\0' + text.casefold().encode('utf-8') + b'\0' + text.encode('utf-8')
 
 
 def get_all_stops_sorted(tram_routes):
@@ -145,20 +2503,156 @@ def get_all_stops_sorted(tram_routes):
     Отримання усіх зупинок, на яких зупиняються трамваї,
     посортована за українським алфавітом
 
+    Порядок обчислюється один раз для версії даних і спільний для всіх вікон, тому
+    змінювати повернений список не можна.
+
     tram_routes - словник з інформацією про трамвайні маршрути
     повертає: список усіх зупинок, на яких зупиняються трамваї, посортованих за українським алфавітом
     """
-    ukraine_alphabet = 'абвгґдеєжзиіїйклмнопрстуфхцчшщьюя'
-    alphabet_index = {char: index for index, char in enumerate(ukraine_alphabet)}
-    all_stops = set()
-    for tram, routes in tram_routes.items():
-        all_stops.update(routes[3])
+    index = get_network_index(tram_routes)
+    if index['stops_sorted'] is None:
+        served_stops = [stop for stop_id, stop in enumerate(index['stop_names']) if index['stop_routes'][stop_id]]
+        index['stops_sorted'] = sorted(served_stops, key=collation_key)
+    return index['stops_sorted']
+
+
+# Abbreviated street types that are ignored when matching stop names
+STOP_NAME_PREFIXES = ('вул.', 'пл.', 'просп.', 'пр.')
+# Maximum number of suggestions shown in a stop combobox
+STOP_SEARCH_LIMIT = 100
+# Minimum trigram similarity for typo-tolerant matches
+STOP_SEARCH_MIN_SIMILARITY = 0.3
+
+
+def normalize_stop_name(stop_name):
+    """
+    Нормалізація назви зупинки для пошуку: нижній регістр, єдиний апостроф,
+    без розділових знаків між словами та скорочень на кшталт "вул." чи "пл."
+
+    stop_name - назва зупинки або введений користувачем текст
+    повертає: нормалізований рядок зі словами через пробіл
+    """
+    text = stop_name.casefold().replace('’', "'").replace('ʼ', "'")
+    words = []
+    for word in text.replace(',', ' ').replace('-', ' ').split():
+        for prefix in STOP_NAME_PREFIXES:
+            if word.startswith(prefix):
+                word = word[len(prefix):]
+                break
+        if word:
+            words.append(word)
+    return ' '.join(words)
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_stop_search_index(stops_sorted):
+    """
+    Побудова індексу пошуку зупинок за назвою
+
+    stops_sorted - список зупинок за українським алфавітом
+    повертає: словник з індексом пошуку:
+        stops - список зупинок, позиція у якому є ідентифікатором зупинки в індексі
+        names - множина назв зупинок для перевірки введених даних
+        keys - посортовані нормалізовані назви, починаючи з кожного слова назви, для пошуку за префіксом
+        key_stops - позиції зупинок для відповідних ключів keys
+        trigrams - відображення триграми у список позицій зупинок, що її містять
+        trigram_counts - кількість різних триграм у назві кожної зупинки
+    """
+    entries = []
+    trigrams = {}
+    trigram_counts = []
+    for position, stop in enumerate(stops_sorted):
+        words = normalize_stop_name(stop).split()
+        # Index every word start so that "лема" finds "Площа Лема"
+        entries.extend((' '.join(words[start:]), position) for start in range(len(words)))
+
+        stop_trigrams = _trigrams(' '.join(words))
+        trigram_counts.append(len(stop_trigrams))
+        for trigram in stop_trigrams:
+            trigrams.setdefault(trigram, []).append(position)
+
+    entries.sort()
+    return {
+        'stops': stops_sorted,
+        'names': frozenset(stops_sorted),
+        'keys': [key for key, _ in entries],
+        'key_stops': [position for _, position in entries],
+        'trigrams': trigrams,
+        'trigram_counts': trigram_counts,
+    }
+
+
+def get_stop_search_index(tram_routes):
+    """
+    Отримання індексу пошуку зупинок, що будується один раз для мережі
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: індекс пошуку зупинок, див. build_stop_search_index
+    """
+    index = get_network_index(tram_routes)
+    if index['stop_search'] is None:
+        index['stop_search'] = build_stop_search_index(get_all_stops_sorted(tram_routes))
+    return index['stop_search']
+
+
+def is_known_stop(tram_routes, stop_name):
+    """
+    Перевірка, чи зупиняються трамваї на зупинці з такою назвою
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    stop_name - назва зупинки
+    повертає: True, якщо зупинка є у списку зупинок
+    """
+    return stop_name in get_stop_search_index(tram_routes)['names']
 
-    # Sort the stops using the custom key
-    return sorted(all_stops, key=lambda x: [alphabet_index[char] for char in x.lower() if char in alphabet_index])
 
+def search_stops(tram_routes, text, limit=STOP_SEARCH_LIMIT):
+    """
+    Пошук зупинок за початком назви або будь-якого її слова, а якщо таких мало -
+    за схожістю назви (з урахуванням помилок у введенні)
 
-all_stops = get_all_stops_sorted(trams)
+    tram_routes - словник з інформацією про трамвайні маршрути
+    text - введений користувачем текст
+    limit - найбільша кількість зупинок у результаті
+    повертає: список назв зупинок: спершу за префіксом у порядку алфавіту, далі схожі за спаданням схожості
+    """
+    search = get_stop_search_index(tram_routes)
+    stops = search['stops']
+    query = normalize_stop_name(text)
+    if not query:
+        return stops[:limit]
+
+    keys = search['keys']
+    key_stops = search['key_stops']
+    matches = set()
+    position = bisect.bisect_left(keys, query)
+    while position < len(keys) and keys[position].startswith(query):
+        matches.add(key_stops[position])
+        position += 1
+    result = sorted(matches)[:limit]
+
+    if len(result) < limit and len(query) >= 3:
+        query_trigrams = _trigrams(query)
+        shared = {}
+        for trigram in query_trigrams:
+            for stop_position in search['trigrams'].get(trigram, ()):
+                shared[stop_position] = shared.get(stop_position, 0) + 1
+
+        scored = []
+        for stop_position, count in shared.items():
+            if stop_position in matches:
+                continue
+            similarity = count / (len(query_trigrams) + search['trigram_counts'][stop_position] - count)
+            if similarity >= STOP_SEARCH_MIN_SIMILARITY:
+                scored.append((-similarity, stop_position))
+        scored.sort()
+        result += [stop_position for _, stop_position in scored[:limit - len(result)]]
+
+    return [stops[stop_position] for stop_position in result]
 
 
 def how_many_stops(tram_routes, start_stop, end_stop):
@@ -170,12 +2664,19 @@ def how_many_stops(tram_routes, start_stop, end_stop):
         end_stop - назва кінцевої зупинки
         повертає: текст з інформацією про кількість зупинок та пересадок
         """
-    route = find_best_route(tram_routes, start_stop, end_stop)
-    if not route:
-        return "Маршрут не знайдено. Перевірте коректність введених назв зупинок."
+    matrices = get_distance_matrices(tram_routes)
+    if matrices is not None:
+        distance = lookup_distance(matrices, start_stop, end_stop)
+        if distance is None:
+            return "Маршрут не знайдено. Перевірте коректність введених назв зупинок."
+        transfers, total_stops = distance
+    else:
+        route = find_best_route(tram_routes, start_stop, end_stop)
+        if not route:
+            return "Маршрут не знайдено. Перевірте коректність введених назв зупинок."
 
-    total_stops = sum(count for _, _, count in route)
-    transfers = len(route) - 1
+        total_stops = sum(count for _, _, count in route)
+        transfers = len(route) - 1
 
     if total_stops == 1:
         stops_text = "1 зупинка"
@@ -195,62 +2696,394 @@ def how_many_stops(tram_routes, start_stop, end_stop):
         return f"{stops_text} {transfers_text}."
 
 
-def open_route_window():
+# Values marking a pair of stops without any route between them (the largest uint8 and uint16 values,
+# written out so that NumPy is not imported at start-up)
+UNREACHABLE_TRANSFERS = 255
+UNREACHABLE_STOPS = 65535
+
+
+def build_distance_matrices(tram_routes):
+    """
+    Попереднє обчислення матриць відстаней між усіма парами зупинок
+
+    Для кожної пари зупинок зберігається найменша кількість пересадок та кількість зупинок маршруту
+    з найменшою кількістю пересадок (найкоротшого серед таких), тобто саме той маршрут,
+    який повертає find_best_route.
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: словник з матрицями:
+        stops_sorted - список зупинок, позиція у якому є індексом рядка та стовпця матриць
+        stop_index - відображення назви зупинки у її індекс у матрицях
+        transfers - матриця uint8 з кількістю пересадок (UNREACHABLE_TRANSFERS - маршруту немає)
+        stops - матриця uint16 з кількістю зупинок (UNREACHABLE_STOPS - маршруту немає)
+        version - відбиток даних, для яких обчислено матриці
+    """
+    import numpy as np
+
+    index = get_network_index(tram_routes)
+    stops_sorted = get_all_stops_sorted(tram_routes)
+    stop_index = {stop: position for position, stop in enumerate(stops_sorted)}
+    # Matrix position of every stop ID of the network index
+    positions = {index['stop_ids'][stop]: position for position, stop in enumerate(stops_sorted)}
+
+    size = len(stops_sorted)
+    transfers = np.full((size, size), UNREACHABLE_TRANSFERS, dtype=np.uint8)
+    stops = np.full((size, size), UNREACHABLE_STOPS, dtype=np.uint16)
+
+    stop_ids = np.array(list(positions), dtype=np.int64)
+    columns = np.array(list(positions.values()), dtype=np.int64)
+    for start_id, row in positions.items():
+        rounds = _sweep_rounds(index, start_id)[1:, stop_ids]
+        reached = rounds < _SWEEP_UNREACHED
+        found = reached.any(axis=0)
+        found[columns == row] = False
+        # The first round that reaches a stop gives the fewest transfers and the stops of that journey
+        first_round = reached.argmax(axis=0)[found]
+        transfers[row, columns[found]] = first_round
+        stops[row, columns[found]] = rounds[first_round, np.flatnonzero(found)]
+
+    return {
+        'stops_sorted': stops_sorted,
+        'stop_index': stop_index,
+        'transfers': transfers,
+        'stops': stops,
+        'version': index['version'],
+    }
+
+
+def save_distance_matrices(matrices, file_path):
+    """
+    Збереження матриць відстаней у файл формату NumPy (.npz)
+
+    matrices - матриці, обчислені build_distance_matrices
+    file_path - шлях до файлу
+    """
+    import numpy as np
+
+    with open(file_path, 'wb') as file:
+        np.savez_compressed(file, stops_sorted=np.array(matrices['stops_sorted']),
+                            transfers=matrices['transfers'], stops=matrices['stops'],
+                            version=np.array(matrices['version']))
+
+
+def load_distance_matrices(file_path, tram_routes):
+    """
+    Завантаження матриць відстаней з файлу
+
+    file_path - шлях до файлу, збереженого save_distance_matrices
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: матриці відстаней або None, якщо файлу немає чи він обчислений для інших даних
+    """
+    import numpy as np
+
+    if not os.path.exists(file_path):
+        return None
+
+    with np.load(file_path) as data:
+        version = str(data['version'])
+        if version != get_network_index(tram_routes)['version']:
+            return None
+        stops_sorted = data['stops_sorted'].tolist()
+        return {
+            'stops_sorted': stops_sorted,
+            'stop_index': {stop: position for position, stop in enumerate(stops_sorted)},
+            'transfers': data['transfers'],
+            'stops': data['stops'],
+            'version': version,
+        }
+
+
+def get_distance_matrices(tram_routes):
+    """
+    Отримання матриць відстаней з файлу DISTANCE_MATRICES_FILE, якщо вони відповідають заданим маршрутам
+
+    Файл читається лише при першому зверненні для кожної версії даних.
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: матриці відстаней або None
+    """
+    global _distance_matrices
+    version = get_network_index(tram_routes)['version']
+    if _distance_matrices is None or _distance_matrices[0] != version:
+        _distance_matrices = (version, load_distance_matrices(DISTANCE_MATRICES_FILE, tram_routes))
+    return _distance_matrices[1]
+
+
+def lookup_distance(matrices, start_stop, end_stop):
+    """
+    Отримання кількості пересадок та зупинок між двома зупинками з матриць відстаней
+
+    matrices - матриці відстаней
+    start_stop - назва початкової зупинки
+    end_stop - назва кінцевої зупинки
+    повертає: кортеж (кількість пересадок, кількість зупинок) або None, якщо маршруту немає
+    """
+    stop_index = matrices['stop_index']
+    if start_stop not in stop_index or end_stop not in stop_index or start_stop == end_stop:
+        return None
+
+    row = stop_index[start_stop]
+    column = stop_index[end_stop]
+    transfers = int(matrices['transfers'][row, column])
+    if transfers == UNREACHABLE_TRANSFERS:
+        return None
+    return transfers, int(matrices['stops'][row, column])
+
+
+DISTANCE_MATRICES_FILE = 'TramsInfo.matrices.npz'
+# (data version, matrices or None) for the last version the file was read for
+_distance_matrices = None
+
+# How often (ms) the Tk loop checks whether a background query has finished
+QUERY_POLL_INTERVAL = 30
+QUERY_BUSY_TEXT = "Зачекайте, триває пошук..."
+_query_executor = None
+# owner widget -> future of its latest query; a new query for the same widget supersedes the old one
+_pending_queries = {}
+
+
+def _get_query_executor():
+    global _query_executor
+    if _query_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        _query_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='query')
+    return _query_executor
+
+
+def run_query(owner, work, on_done, busy_text=QUERY_BUSY_TEXT):
+    """
+    Виконання запиту у фоновому потоці без блокування графічного інтерфейсу
+
+    Поки запит виконується, у вікні показується курсор очікування, а у полі owner - busy_text.
+    Попередній незавершений запит для того ж owner скасовується.
+
+    owner - віджет, для якого виконується запит (зазвичай текстове поле для результату)
+    work - функція без аргументів, що виконує пошук у фоновому потоці
+    on_done - функція, що отримує результат work і виконується у головному потоці Tk
+    busy_text - текст, що показується у owner під час пошуку, або None, якщо owner - не текстове поле
+    """
+    cancel_query(owner)
+    if busy_text:
+        owner.delete(1.0, tk.END)
+        owner.insert(tk.END, busy_text)
+    _set_busy(owner, True)
+
+    future = _get_query_executor().submit(work)
+    _pending_queries[owner] = future
+    owner.after(QUERY_POLL_INTERVAL, _poll_query, owner, future, on_done, busy_text)
+
+
+def cancel_query(owner):
+    """
+    Скасування незавершеного запиту для віджета
+
+    Запит, що вже виконується, завершиться у фоновому потоці, але його результат буде відкинуто.
+
+    owner - віджет, для якого виконувався запит
+    """
+    future = _pending_queries.pop(owner, None)
+    if future is not None:
+        future.cancel()
+        _set_busy(owner, False)
+
+
+def _poll_query(owner, future, on_done, busy_text):
+    if _pending_queries.get(owner) is not future:
+        # Superseded or cancelled
+        return
+    if not future.done():
+        owner.after(QUERY_POLL_INTERVAL, _poll_query, owner, future, on_done, busy_text)
+        return
+
+    del _pending_queries[owner]
+    try:
+        if not owner.winfo_exists():
+            # The window was closed while the query was running
+            return
+        _set_busy(owner, False)
+        if busy_text:
+            owner.delete(1.0, tk.END)
+    except tk.TclError:
+        return
+
+    error = future.exception()
+    if error is not None:
+        messagebox.showerror("Помилка", f"Не вдалося виконати запит: {error}")
+        return
+    on_done(future.result())
+
+
+def _set_busy(owner, busy):
+    try:
+        owner.winfo_toplevel().config(cursor='watch' if busy else '')
+    except tk.TclError:
+        pass
+
+
+def _cancel_on_change(combobox, owner):
+    """
+    Скасування запиту для owner, коли користувач змінює значення у списку зупинок
+
+    combobox - список вибору зупинки
+    owner - віджет, для якого виконується запит
+    """
+    combobox.bind('<<ComboboxSelected>>', lambda event: cancel_query(owner), add='+')
+    combobox.bind('<KeyRelease>', lambda event: cancel_query(owner), add='+')
+
+
+def _bind_stop_search(combobox):
+    """
+    Фільтрування списку зупинок у combobox під час введення назви
+
+    combobox - список вибору зупинки
+    """
+    def update_values(event):
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+        # Always search the current data, which may have been reloaded since the window was opened
+        combobox.configure(values=search_stops(get_trams(), combobox.get()))
+
+    combobox.configure(values=search_stops(get_trams(), ''))
+    combobox.bind('<KeyRelease>', update_values, add='+')
+
+
+def open_route_window():
+    """
+    Відкриття вікна для пошуку маршруту між двома зупинками
+    """
+    route_window = tk.Toplevel()
+    route_window.title("Пошук маршруту")
+
+    label1 = tk.Label(route_window, text="Ви хочете дізнатись як потрапити з однієї зупинки на іншу?")
+    label1.pack(pady=10)
+
+    label2 = tk.Label(route_window, text="Виберіть з списку назви трамвайних зупинок")
+    label2.pack(pady=10)
+
+    frame = tk.Frame(route_window)
+    frame.pack(pady=10)
+
+    start_label = tk.Label(frame, text="Початкова зупинка:")
+    start_label.grid(row=0, column=0, padx=5, pady=5)
+    start_stop = ttk.Combobox(frame)
+    start_stop.grid(row=0, column=1, padx=5, pady=5)
+    _bind_stop_search(start_stop)
+
+    end_label = tk.Label(frame, text="Зупинка-призначення:")
+    end_label.grid(row=1, column=0, padx=5, pady=5)
+    end_stop = ttk.Combobox(frame)
+    end_stop.grid(row=1, column=1, padx=5, pady=5)
+    _bind_stop_search(end_stop)
+
+    search_button = tk.Button(frame, text="Пошуку маршруту",
+                              command=lambda: find_route(start_stop.get(), end_stop.get(), result_text))
+    search_button.grid(row=2, column=0, columnspan=2, pady=10)
+
+    result_text = tk.Text(route_window, height=10, width=50, wrap=tk.WORD)
+    result_text.pack(pady=10)
+
+    _cancel_on_change(start_stop, result_text)
+    _cancel_on_change(end_stop, result_text)
+
+
+def find_route(start, end, result_text):
+    """
+        Пошук маршруту між двома зупинками та відображення результату
+
+        start - назва початкової зупинки
+        end - назва кінцевої зупинки
+        result_text - текстове поле для відображення результату
+        """
+    result_text.delete(1.0, tk.END)
+
+    if not start or not end:
+        messagebox.showwarning("Недостатньо даних", "Будь ласка, введіть усі необхідні дані.")
+        return
+
+    trams = get_trams()
+    if not is_known_stop(trams, start) or not is_known_stop(trams, end):
+        result_text.insert(tk.END, "Маршрут не знайдено. Перевірте коректність введених назв зупинок.")
+        return
+
+    run_query(result_text, lambda: create_route_text(trams, start, end),
+              lambda route_text: result_text.insert(tk.END, route_text))
+
+
+def open_arrival_window():
     """
-    Відкриття вікна для пошуку маршруту між двома зупинками
+    Відкриття вікна для пошуку часу прибуття за розкладом
     """
-    route_window = tk.Toplevel()
-    route_window.title("Пошук маршруту")
+    arrival_window = tk.Toplevel()
+    arrival_window.title("Коли я приїду")
 
-    label1 = tk.Label(route_window, text="Ви хочете дізнатись як потрапити з однієї зупинки на іншу?")
+    label1 = tk.Label(arrival_window, text="Ви хочете дізнатись, коли будете на місці?")
     label1.pack(pady=10)
 
-    label2 = tk.Label(route_window, text="Виберіть з списку назви трамвайних зупинок")
+    label2 = tk.Label(arrival_window, text="Виберіть з списку назви трамвайних зупинок та вкажіть час відправлення")
     label2.pack(pady=10)
 
-    frame = tk.Frame(route_window)
-    frame.pack(pady=10)
-
-    all_stops = get_all_stops_sorted(trams)
+    frame = tk.Frame(arrival_window)
+    frame.pack(pady=10, padx=25)
 
     start_label = tk.Label(frame, text="Початкова зупинка:")
     start_label.grid(row=0, column=0, padx=5, pady=5)
-    start_stop = ttk.Combobox(frame, values=all_stops)
+    start_stop = ttk.Combobox(frame)
     start_stop.grid(row=0, column=1, padx=5, pady=5)
+    _bind_stop_search(start_stop)
 
     end_label = tk.Label(frame, text="Зупинка-призначення:")
     end_label.grid(row=1, column=0, padx=5, pady=5)
-    end_stop = ttk.Combobox(frame, values=all_stops)
+    end_stop = ttk.Combobox(frame)
     end_stop.grid(row=1, column=1, padx=5, pady=5)
+    _bind_stop_search(end_stop)
 
-    search_button = tk.Button(frame, text="Пошуку маршруту",
-                              command=lambda: find_route(start_stop.get(), end_stop.get(), result_text))
-    search_button.grid(row=2, column=0, columnspan=2, pady=10)
+    time_label = tk.Label(frame, text="Час відправлення (ГГ:ХХ):")
+    time_label.grid(row=2, column=0, padx=5, pady=5)
+    departure_time = tk.Entry(frame)
+    departure_time.insert(0, time.strftime('%H:%M'))
+    departure_time.grid(row=2, column=1, padx=5, pady=5)
 
-    result_text = tk.Text(route_window, height=10, width=50, wrap=tk.WORD)
+    search_button = tk.Button(frame, text="Пошук часу прибуття",
+                              command=lambda: find_arrival(start_stop.get(), end_stop.get(), departure_time.get(),
+                                                           result_text))
+    search_button.grid(row=3, column=0, columnspan=2, pady=10)
+
+    result_text = tk.Text(arrival_window, height=10, width=60, wrap=tk.WORD)
     result_text.pack(pady=10)
 
+    _cancel_on_change(start_stop, result_text)
+    _cancel_on_change(end_stop, result_text)
 
-def find_route(start, end, result_text):
+
+def find_arrival(start, end, departure_time, result_text):
     """
-        Пошук маршруту між двома зупинками та відображення результату
+    Пошук поїздки з найранішим прибуттям та відображення результату
 
-        start - назва початкової зупинки
-        end - назва кінцевої зупинки
-        result_text - текстове поле для відображення результату
-        """
+    start - назва початкової зупинки
+    end - назва кінцевої зупинки
+    departure_time - час відправлення у форматі ГГ:ХХ
+    result_text - текстове поле для відображення результату
+    """
     result_text.delete(1.0, tk.END)
 
-    if not start or not end:
+    if not start or not end or not departure_time:
         messagebox.showwarning("Недостатньо даних", "Будь ласка, введіть усі необхідні дані.")
         return
 
-    if start not in all_stops or end not in all_stops:
+    try:
+        departure = parse_clock(departure_time)
+    except ValueError as error:
+        messagebox.showwarning("Некоректний час", str(error))
+        return
+
+    trams = get_trams()
+    if not is_known_stop(trams, start) or not is_known_stop(trams, end):
         result_text.insert(tk.END, "Маршрут не знайдено. Перевірте коректність введених назв зупинок.")
         return
 
-    route_text = create_route_text(trams, start, end)
-    result_text.insert(tk.END, route_text)
+    run_query(result_text, lambda: create_arrival_text(trams, start, end, departure),
+              lambda arrival_text: result_text.insert(tk.END, arrival_text))
 
 
 def open_how_many_stops_window():
@@ -269,17 +3102,17 @@ def open_how_many_stops_window():
     frame = tk.Frame(stops_window)
     frame.pack(pady=10, padx=25)
 
-    all_stops = get_all_stops_sorted(trams)
-
     start_label = tk.Label(frame, text="Початкова зупинка:")
     start_label.grid(row=0, column=0, padx=5, pady=5)
-    start_stop = ttk.Combobox(frame, values=all_stops)
+    start_stop = ttk.Combobox(frame)
     start_stop.grid(row=0, column=1, padx=5, pady=5)
+    _bind_stop_search(start_stop)
 
     end_label = tk.Label(frame, text="Зупинка-призначення:")
     end_label.grid(row=1, column=0, padx=5, pady=5)
-    end_stop = ttk.Combobox(frame, values=all_stops)
+    end_stop = ttk.Combobox(frame)
     end_stop.grid(row=1, column=1, padx=5, pady=5)
+    _bind_stop_search(end_stop)
 
     search_button = tk.Button(frame, text="Пошукі зупинок",
                               command=lambda: find_stops(start_stop.get(), end_stop.get(), result_text))
@@ -288,6 +3121,9 @@ def open_how_many_stops_window():
     result_text = tk.Text(stops_window, height=10, width=50, wrap=tk.WORD)
     result_text.pack(pady=10)
 
+    _cancel_on_change(start_stop, result_text)
+    _cancel_on_change(end_stop, result_text)
+
 
 def find_stops(start, end, result_text):
     """
@@ -305,12 +3141,13 @@ def find_stops(start, end, result_text):
         return
 
     # Check if entered stops are valid
-    if start not in all_stops or end not in all_stops:
+    trams = get_trams()
+    if not is_known_stop(trams, start) or not is_known_stop(trams, end):
         result_text.insert(tk.END, "Маршрут не знайдено. Перевірте коректність введених назв зупинок.")
         return
 
-    stops_text = how_many_stops(trams, start, end)
-    result_text.insert(tk.END, stops_text)
+    run_query(result_text, lambda: how_many_stops(trams, start, end),
+              lambda stops_text: result_text.insert(tk.END, stops_text))
 
 
 def open_can_reach_window():
@@ -329,17 +3166,17 @@ def open_can_reach_window():
     frame = tk.Frame(reach_window)
     frame.pack(pady=10, padx=25)
 
-    all_stops = get_all_stops_sorted(trams)
-
     start_label = tk.Label(frame, text="Початкова зупинка:")
     start_label.grid(row=0, column=0, padx=5, pady=5)
-    start_stop = ttk.Combobox(frame, values=all_stops)
+    start_stop = ttk.Combobox(frame)
     start_stop.grid(row=0, column=1, padx=5, pady=5)
+    _bind_stop_search(start_stop)
 
     end_label = tk.Label(frame, text="Зупинка-призначення:")
     end_label.grid(row=1, column=0, padx=5, pady=5)
-    end_stop = ttk.Combobox(frame, values=all_stops)
+    end_stop = ttk.Combobox(frame)
     end_stop.grid(row=1, column=1, padx=5, pady=5)
+    _bind_stop_search(end_stop)
 
     search_button = tk.Button(frame, text="Перевірити можливість",
                               command=lambda: find_can_reach(start_stop.get(), end_stop.get(), result_text))
@@ -348,6 +3185,37 @@ def open_can_reach_window():
     result_text = tk.Text(reach_window, height=10, width=50, wrap=tk.WORD)
     result_text.pack(pady=10)
 
+    _cancel_on_change(start_stop, result_text)
+    _cancel_on_change(end_stop, result_text)
+
+
+def create_can_reach_text(tram_routes, start_stop, end_stop):
+    """
+    Перевірка можливості дістатися від однієї зупинки до іншої
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    start_stop - назва початкової зупинки
+    end_stop - назва кінцевої зупинки
+    повертає: текст з інформацією про трамваї та пересадки
+    """
+    # Only the trams are shown, so the transfer graph answers without any stop-level search
+    index = get_network_index(tram_routes)
+    start_id = _served_stop_id(index, start_stop)
+    end_id = _served_stop_id(index, end_stop)
+    trams = None
+    if start_id is not None and end_id is not None and start_id != end_id:
+        trams = _transfer_trams(index, start_id, end_id)
+    if not trams:
+        return "Маршрут не знайдено. Перевірте коректність введених назв зупинок."
+
+    if len(trams) == 1:
+        return f"Можна, використовуючи трамвай №{trams[0]}"
+
+    transfers_text = "Можна, з пересадкою"
+    for i in range(len(trams) - 1):
+        transfers_text += f" з трамваю №{trams[i]} на трамвай №{trams[i + 1]}"
+    return transfers_text
+
 
 def find_can_reach(start, end, result_text):
     """
@@ -362,22 +3230,108 @@ def find_can_reach(start, end, result_text):
         messagebox.showwarning("Недостатньо даних", "Будь ласка, введіть усі необхідні дані.")
         return
 
-    if start not in all_stops or end not in all_stops:
+    trams = get_trams()
+    if not is_known_stop(trams, start) or not is_known_stop(trams, end):
         result_text.insert(tk.END, "Маршрут не знайдено. Перевірте коректність введених назв зупинок.")
         return
 
-    route = find_best_route(trams, start, end)
-    if not route:
-        result_text.insert(tk.END, "Маршрут не знайдено. Перевірте коректність введених назв зупинок.")
-        return
+    run_query(result_text, lambda: create_can_reach_text(trams, start, end),
+              lambda reach_text: result_text.insert(tk.END, reach_text))
+
+
+LAYOUT_FILE = 'TramsInfo.layout.json'
+
 
-    if len(route) == 1:
-        result_text.insert(tk.END, f"Можна, використовуючи трамвай №{route[0][0]}")
+def build_network_graph(tram_routes):
+    """
+    Побудова графа трамвайної мережі для відображення на схемі
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: граф networkx, ребра якого мають атрибут tram з номером трамваю
+    """
+    import networkx as nx
+
+    G = nx.Graph()
+    for tram, route in tram_routes.items():
+        stops = route.direct + route.reverse
+        for i in range(len(stops) - 1):
+            G.add_edge(stops[i], stops[i + 1], tram=tram)
+    return G
+
+
+def compute_network_layout(tram_routes, initial=None):
+    """
+    Обчислення координат усіх зупинок мережі для схеми руху
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    initial - відомі координати зупинок, що залишаються на місці (розміщуються лише інші зупинки), або None
+    повертає: словник координат (x, y) за назвою зупинки
+    """
+    import networkx as nx
+
+    graph = build_network_graph(tram_routes)
+    fixed = [stop for stop in graph if initial and stop in initial]
+    if fixed:
+        pos = nx.spring_layout(graph, pos={stop: initial[stop] for stop in fixed}, fixed=fixed, seed=42, k=0.02)
     else:
-        transfers_text = "Можна, з пересадкою"
-        for i in range(len(route) - 1):
-            transfers_text += f" з трамваю №{route[i][0]} на трамвай №{route[i + 1][0]}"
-        result_text.insert(tk.END, transfers_text)
+        pos = nx.spring_layout(graph, seed=42, k=0.02)
+    return {stop: (float(x), float(y)) for stop, (x, y) in pos.items()}
+
+
+def save_network_layout(layout, file_path, version):
+    """
+    Збереження координат зупинок у файл
+
+    layout - словник координат за назвою зупинки
+    file_path - шлях до файлу
+    version - відбиток даних, для яких обчислено координати
+    """
+    temporary_file = file_path + '.tmp'
+    with open(temporary_file, 'w', encoding='utf-8') as file:
+        json.dump({'version': version, 'positions': layout}, file, ensure_ascii=False)
+    os.replace(temporary_file, file_path)
+
+
+def load_network_layout(file_path, version):
+    """
+    Завантаження координат зупинок з файлу
+
+    file_path - шлях до файлу, збереженого save_network_layout
+    version - відбиток поточних даних
+    повертає: словник координат за назвою зупинки або None, якщо файлу немає або він для інших даних
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if data.get('version') != version:
+        return None
+    return {stop: tuple(position) for stop, position in data['positions'].items()}
+
+
+def get_network_layout(tram_routes):
+    """
+    Отримання координат зупинок для схеми мережі
+
+    Координати обчислюються один раз для версії даних і зберігаються у файлі LAYOUT_FILE,
+    тож наступні запуски програми беруть їх з файлу.
+
+    tram_routes - словник з інформацією про трамвайні маршрути
+    повертає: словник координат (x, y) за назвою зупинки
+    """
+    index = get_network_index(tram_routes)
+    if index['layout'] is None:
+        layout = load_network_layout(LAYOUT_FILE, index['version'])
+        if layout is None:
+            layout = compute_network_layout(tram_routes, index['layout_seed'])
+            try:
+                save_network_layout(layout, LAYOUT_FILE, index['version'])
+            except OSError:
+                pass  # The layout is still cached in memory for this process
+        index['layout'] = layout
+    return index['layout']
 
 
 def open_tram_route_window():
@@ -393,7 +3347,7 @@ def open_tram_route_window():
     frame = tk.Frame(tram_route_window)
     frame.pack(pady=10, padx=25)
 
-    tram_numbers = sorted(trams.keys())
+    tram_numbers = sorted(get_trams().keys())
     tram_label = tk.Label(frame, text="Номер трамваю:")
     tram_label.grid(row=0, column=0, padx=5, pady=5)
     tram_number = ttk.Combobox(frame, values=tram_numbers)
@@ -406,6 +3360,8 @@ def open_tram_route_window():
     result_text = tk.Text(tram_route_window, height=15, width=60, wrap=tk.WORD)
     result_text.pack(pady=10)
 
+    _cancel_on_change(tram_number, result_text)
+
 
 def show_tram_route(tram_number, result_text):
     """
@@ -415,54 +3371,166 @@ def show_tram_route(tram_number, result_text):
     """
     result_text.delete(1.0, tk.END)
 
+    trams = get_trams()
     if not tram_number or not tram_number.isdigit() or int(tram_number) not in trams:
         messagebox.showwarning("Недостатньо даних", "Будь ласка, виберіть номер трамваю зі списку.")
         return
 
-    tram_number = int(tram_number)
-    route_info = trams[tram_number]
-    route_name = route_info[0]
-    direct_route = route_info[1]
-    reverse_route = route_info[2]
+    def compute_layout():
+        # Route plots reuse the positions of the city scheme
+        with metrics.stage('plot.layout'):
+            return get_network_layout(trams)
 
-    result_text.insert(tk.END, f"Маршрут №{tram_number}\n")
-    result_text.insert(tk.END, f"{route_name}\n")
-    result_text.insert(tk.END, f"Прямий напрямок:\n{' - '.join(direct_route)}\n")
-    result_text.insert(tk.END, f"Зворотній напрямок:\n{' - '.join(reverse_route)}\n")
+    run_query(result_text, compute_layout,
+              lambda layout: _draw_tram_route(trams[int(tram_number)], layout, result_text))
 
-    G = nx.Graph()
-    stops = direct_route + reverse_route
-    for i in range(len(stops) - 1):
-        G.add_edge(stops[i], stops[i + 1], tram=tram_number)
 
-    plt.clf()
+# Figures of the open plotting windows, keyed by Toplevel; each window keeps one Figure for its lifetime
+_figure_pool = {}
 
-    fig, ax = plt.subplots(figsize=(12, 10))
-    pos = nx.spring_layout(G, seed=42, k=0.02)
 
-    tram_color = "#" + ''.join([random.choice('0123456789ABCDEF') for _ in range(6)])
+def get_plot_canvas(window):
+    """
+    Отримання полотна з графіком для вікна (одна фігура на вікно, звільняється при закритті вікна)
+
+    window - вікно Toplevel
+    повертає: словник з ключами figure, axes, canvas, nodes, edges, labels, edge_labels
+    """
+    plot = _figure_pool.get(window)
+    if plot is None:
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.collections import LineCollection
+        from matplotlib.figure import Figure
+
+        # A bare Figure is not registered with pyplot, so nothing outlives the window
+        figure = Figure(figsize=(12, 10))
+        axes = figure.add_subplot()
+        axes.tick_params(axis="both", which="both", bottom=False, left=False, labelbottom=False, labelleft=False)
+        edges = LineCollection([], zorder=1)
+        axes.add_collection(edges)
+        nodes = axes.scatter([], [], s=100, edgecolors='k', zorder=2)
+
+        canvas = FigureCanvasTkAgg(figure, master=window)
+        canvas.get_tk_widget().pack(pady=10)
+        plot = {'figure': figure, 'axes': axes, 'canvas': canvas, 'nodes': nodes, 'edges': edges,
+                'labels': [], 'edge_labels': []}
+        _figure_pool[window] = plot
+        window.bind('<Destroy>', lambda event: release_plot_canvas(window) if event.widget is window else None,
+                    add='+')
+    return plot
+
+
+def release_plot_canvas(window):
+    """
+    Звільнення фігури та полотна вікна
+
+    window - вікно Toplevel
+    """
+    plot = _figure_pool.pop(window, None)
+    if plot is None:
+        return
+    plot['figure'].clear()
+    widget = plot['canvas'].get_tk_widget()
+    if widget.winfo_exists():
+        widget.destroy()
+
+
+def _sync_texts(axes, texts, items, **style):
+    """
+    Оновлення підписів на графіку на місці: наявні підписи переміщуються, зайві видаляються
+
+    axes - вісі графіка
+    texts - список наявних підписів (змінюється на місці)
+    items - список кортежів (x, y, текст)
+    style - параметри нових підписів
+    """
+    for text, (x, y, label) in zip(texts, items):
+        text.set_position((x, y))
+        text.set_text(label)
+    for x, y, label in items[len(texts):]:
+        texts.append(axes.text(x, y, label, **style))
+    for text in texts[len(items):]:
+        text.remove()
+    del texts[len(items):]
+
 
-    nx.draw_networkx_nodes(G, pos, node_size=100, node_color="skyblue", edgecolors='k', ax=ax)
+def update_network_plot(window, pos, edges, edge_colors, node_color):
+    """
+    Перемалювання схеми у вікні без створення нової фігури
+
+    window - вікно Toplevel
+    pos - координати зупинок, що відображаються
+    edges - список ребер (зупинка, зупинка, номер трамваю)
+    edge_colors - список кольорів ребер
+    node_color - колір зупинок
+    """
+    import numpy as np
+
+    plot = get_plot_canvas(window)
+    axes = plot['axes']
+    coordinates = np.array(list(pos.values()), dtype=float).reshape(-1, 2)
 
-    nx.draw_networkx_edges(G, pos, edgelist=G.edges(), edge_color=tram_color, ax=ax)
+    plot['nodes'].set_offsets(coordinates)
+    plot['nodes'].set_facecolor(node_color)
+    plot['edges'].set_segments([(pos[u], pos[v]) for u, v, _ in edges])
+    plot['edges'].set_color(edge_colors)
 
-    nx.draw_networkx_labels(G, pos, font_size=8, font_weight="light", ax=ax)
+    _sync_texts(axes, plot['labels'], [(x, y, stop) for stop, (x, y) in pos.items()],
+                fontsize=8, fontweight="light", ha='center', va='center', zorder=3)
 
     edge_labels = {}
-    for u, v, data in G.edges(data=True):
+    for u, v, tram in edges:
         if (u, v) in edge_labels:
-            edge_labels[(u, v)] += f", {data['tram']}"
+            edge_labels[(u, v)] += f", {tram}"
         else:
-            edge_labels[(u, v)] = str(data['tram'])
+            edge_labels[(u, v)] = str(tram)
+    _sync_texts(axes, plot['edge_labels'],
+                [((pos[u][0] + pos[v][0]) / 2, (pos[u][1] + pos[v][1]) / 2, label)
+                 for (u, v), label in edge_labels.items()],
+                fontsize=10, color='red', ha='center', va='center', zorder=3,
+                bbox={'boxstyle': 'round', 'ec': (1.0, 1.0, 1.0), 'fc': (1.0, 1.0, 1.0)})
+
+    if len(coordinates):
+        low, high = coordinates.min(axis=0), coordinates.max(axis=0)
+        margin = np.maximum((high - low) * 0.05, 0.05)
+        axes.set_xlim(low[0] - margin[0], high[0] + margin[0])
+        axes.set_ylim(low[1] - margin[1], high[1] + margin[1])
+    # Rendered right away rather than with draw_idle, so that the plot.draw and scheme.draw stages
+    # around this call time the actual drawing; each call answers one user action anyway
+    plot['canvas'].draw()
+
+
+def _draw_tram_route(route, layout, result_text):
+    """
+    Виведення маршруту трамваю та його схеми у вікні
+
+    route - маршрут трамваю
+    layout - координати зупинок на схемі мережі
+    result_text - текстове поле для відображення результату
+    """
+    import networkx as nx
 
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_color='red', ax=ax)
+    tram_number = route.number
+    route_name = route.name
+    direct_route = route.direct
+    reverse_route = route.reverse
 
-    if hasattr(show_tram_route, 'canvas') and show_tram_route.canvas:
-        show_tram_route.canvas.get_tk_widget().destroy()
+    result_text.insert(tk.END, f"Маршрут №{tram_number}\n")
+    result_text.insert(tk.END, f"{route_name}\n")
+    result_text.insert(tk.END, f"Прямий напрямок:\n{' - '.join(direct_route)}\n")
+    result_text.insert(tk.END, f"Зворотній напрямок:\n{' - '.join(reverse_route)}\n")
+
+    G = nx.Graph()
+    stops = direct_route + reverse_route
+    for i in range(len(stops) - 1):
+        G.add_edge(stops[i], stops[i + 1], tram=tram_number)
+
+    pos = {stop: layout[stop] for stop in G.nodes}
+    tram_color = "#" + ''.join([random.choice('0123456789ABCDEF') for _ in range(6)])
 
-    show_tram_route.canvas = FigureCanvasTkAgg(fig, master=result_text.master)
-    show_tram_route.canvas.draw()
-    show_tram_route.canvas.get_tk_widget().pack(pady=10)
+    with metrics.stage('plot.draw'):
+        edges = list(G.edges(data='tram'))
+        update_network_plot(result_text.winfo_toplevel(), pos, edges, [tram_color] * len(edges), "skyblue")
 
 
 def open_tram_scheme_window():
@@ -472,39 +3540,74 @@ def open_tram_scheme_window():
     scheme_window = tk.Toplevel()
     scheme_window.title("Схема руху трамваїв міста")
 
-    G = nx.Graph()
+    status_label = tk.Label(scheme_window, text="Зачекайте, будується схема...")
+    status_label.pack(pady=10)
 
-    for tram, routes in trams.items():
-        stops = routes[1] + routes[2]
-        for i in range(len(stops) - 1):
-            G.add_edge(stops[i], stops[i + 1], tram=tram)
+    trams = get_trams()
+
+    def compute_layout():
+        with metrics.stage('scheme.layout'):
+            return get_network_layout(trams)
+
+    def draw(pos):
+        status_label.destroy()
+        _draw_tram_scheme(scheme_window, trams, pos)
 
-    fig, ax = plt.subplots(figsize=(12, 10))
-    pos = nx.spring_layout(G, seed=42, k=0.02)
+    run_query(status_label, compute_layout, draw, busy_text=None)
+
+
+def _draw_tram_scheme(scheme_window, trams, pos):
+    """
+    Виведення схеми руху трамваїв міста у вікні
+
+    scheme_window - вікно для схеми
+    trams - словник з інформацією про трамвайні маршрути
+    pos - координати зупинок на схемі мережі
+    """
+    G = build_network_graph(trams)
 
     tram_colors = {}
     for tram in trams.keys():
         tram_colors[tram] = "#" + ''.join([random.choice('0123456789ABCDEF') for _ in range(6)])
 
-    nx.draw_networkx_nodes(G, pos, node_size=100, node_color="green", edgecolors='k', ax=ax)
+    with metrics.stage('scheme.draw'):
+        # Edges are grouped by tram colour in a single collection
+        edges = sorted(G.edges(data='tram'), key=lambda edge: edge[2])
+        update_network_plot(scheme_window, {stop: pos[stop] for stop in G.nodes}, edges,
+                            [tram_colors[tram] for _, _, tram in edges], "green")
 
-    for u, v, data in G.edges(data=True):
-        nx.draw_networkx_edges(G, pos, edgelist=[(u, v)], edge_color=tram_colors[data['tram']], ax=ax)
 
-    nx.draw_networkx_labels(G, pos, font_size=8, font_weight="light", ax=ax)
+def _state_search_costs(index, start_id):
+    """
+    Найменші кількості трамваїв і зупинок від зупинки до всіх інших пошуком Дейкстри за станами
+    (напрямок, позиція) - перевірка RAPTOR і графа пересадок у протоколі тестування, що від них не залежить
 
-    edge_labels = {}
-    for u, v, data in G.edges(data=True):
-        if (u, v) in edge_labels:
-            edge_labels[(u, v)] += f", {data['tram']}"
+    index - індекс мережі
+    start_id - ідентифікатор початкової зупинки
+    повертає: словник кортежів (кількість трамваїв, кількість зупинок) за ідентифікатором досяжної зупинки
+    """
+    routes = index['routes']
+    stop_routes = index['stop_routes']
+    costs = {}
+    visited = set()
+    # States are (route index, position) on board, or (-1, stop ID) at a stop
+    queue = [(0, 0, -1, start_id)]
+    while queue:
+        trams, stops, route_index, position = heapq.heappop(queue)
+        if (route_index, position) in visited:
+            continue
+        visited.add((route_index, position))
+        if route_index < 0:
+            costs[position] = (trams, stops)
+            for other_route, other_position in stop_routes[position]:
+                heapq.heappush(queue, (trams + 1, stops, other_route, other_position))
         else:
-            edge_labels[(u, v)] = str(data['tram'])
+            route_stops = routes[route_index][2]
+            heapq.heappush(queue, (trams, stops, -1, route_stops[position]))
+            if position + 1 < len(route_stops):
+                heapq.heappush(queue, (trams, stops + 1, route_index, position + 1))
+    return costs
 
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_color='red', ax=ax)
-
-    canvas = FigureCanvasTkAgg(fig, master=scheme_window)
-    canvas.draw()
-    canvas.get_tk_widget().pack(pady=10)
 
 def get_protocole_of_testing():
     with open('InternalProtocole.txt', 'w', encoding='utf-8') as file:
@@ -512,15 +3615,15 @@ def get_protocole_of_testing():
         file.write("Test the process_tram_file function\n")
         trams = process_tram_file('TramsInfo.txt')
         file.write(f"Number of trams: {len(trams)}\n")
-        for tram, routes in trams.items():
+        for tram, route in trams.items():
             # write tram number
             file.write(f"Tram number: {tram}\n")
             # write route name
-            file.write(f"Route name: {routes[0]}\n")
+            file.write(f"Route name: {route.name}\n")
             # write direct route
-            file.write(f"Direct route: {routes[1]}\n")
+            file.write(f"Direct route: {route.direct}\n")
             # write reverse route
-            file.write(f"Reverse route: {routes[2]}\n")
+            file.write(f"Reverse route: {route.reverse}\n")
         file.write("\n")
         file.write("Test the find_trams_by_stop function\n")
         trams_by_stop = find_trams_by_stop(trams, "Залізничний вокзал")
@@ -532,21 +3635,60 @@ def get_protocole_of_testing():
         file.write("Expected result: [(1, ['Залізничний вокзал', 'Приміський вокзал', 'Кропивницького', 'Старосольських', 'Львівська політехніка', 'Головна пошта', 'Дорошенка', 'Площа Ринок'], 7)]\n")
         file.write(f"Best route: {str(best_route)}")
         file.write("\n")
+        file.write("\n")
+        file.write("Test find_best_route and min_transfers against a search over (route, position) states\n")
+        circle = ["Коло 1", "Коло 2", "Коло 3", "Коло 4", "Коло 1"]
+        circle_trams = build_trams(iter_tram_records(
+            ["1", "Коло", DIRECT_ROUTE_PREFIX + " - ".join(circle), REVERSE_ROUTE_PREFIX + "Коло 1 - Депо - Коло 1",
+             "2", "Депо - Кінцева", DIRECT_ROUTE_PREFIX + "Депо - Коло 3 - Кінцева",
+             REVERSE_ROUTE_PREFIX + "Кінцева - Коло 3 - Депо"]), "тестовій мережі")
+        mismatches = []
+        for network in (trams, circle_trams):
+            network_index = get_network_index(network)
+            network_stops = get_all_stops_sorted(network)
+            for start in network_stops:
+                costs = _state_search_costs(network_index, network_index['stop_ids'][start])
+                for end in network_stops:
+                    if start == end:
+                        continue
+                    expected = costs.get(network_index['stop_ids'][end])
+                    route = find_best_route(network, start, end)
+                    found = (len(route), sum(count for _, _, count in route)) if route else None
+                    if found != expected or min_transfers(network, start, end) != (expected and expected[0] - 1):
+                        mismatches.append((start, end))
+        file.write("Expected result: 0 mismatches\n")
+        file.write(f"Mismatches: {len(mismatches)} {mismatches[:5]}\n")
+        file.write(f"Circular route: {find_best_route(circle_trams, 'Коло 3', 'Коло 2')}\n")
+        file.write(f"Can reach: {create_can_reach_text(circle_trams, 'Коло 3', 'Коло 2')}\n")
+        file.write("\n")
+        file.write("Test the plan_alternatives function\n")
+        alternatives = plan_alternatives(trams, "Залізничний вокзал", "Площа Ринок")
+        file.write("Expected result: tram 1, then tram 4 to Київська and tram 2 among the alternatives\n")
+        file.write(f"Alternatives: {[[(tram, stops[0], stops[-1]) for tram, stops, _ in journey] for journey in alternatives]}\n")
+        file.write("\n")
+        file.write("Test skipping shared corridor segments in _run_rounds\n")
+        corridor = [f"Коридор {i}" for i in range(1, CORRIDOR_MIN_STOPS + 2)]
+        corridor_lines = []
+        for tram, ends in [(1, ("Захід", "Схід")), (2, ("Північ", "Південь"))]:
+            direct_route = [f"{ends[0]} 1", f"{ends[0]} 2"] + corridor + [f"{ends[1]} 1", f"{ends[1]} 2"]
+            corridor_lines += [str(tram), f"{ends[0]} - {ends[1]}", DIRECT_ROUTE_PREFIX + " - ".join(direct_route),
+                               REVERSE_ROUTE_PREFIX + " - ".join(reversed(direct_route))]
+        corridor_trams = build_trams(iter_tram_records(corridor_lines), "тестовій мережі")
+        corridor_index = get_network_index(corridor_trams)
+        skipped = 0
+        labels_match = True
+        for start_id in range(len(corridor_index['stop_names'])):
+            search_stats = {}
+            labels, _ = _run_rounds(corridor_index, start_id, stats=search_stats)
+            skipped += search_stats['segments_skipped']
+            swept = _sweep_rounds(corridor_index, start_id, len(labels) - 1).tolist()
+            labels_match &= [[_SWEEP_UNREACHED if label == float('inf') else label for label in round_labels]
+                             for round_labels in labels] == swept[:len(labels)]
+        file.write("Expected result: segments skipped, labels equal to the vectorised sweep\n")
+        file.write(f"Segments skipped: {skipped > 0}, labels equal: {labels_match}\n")
+        file.write(f"Best route: {find_best_route(corridor_trams, 'Захід 1', 'Південь 2')}\n")
         file.close()
 
-get_protocole_of_testing()
-
-def find_trams_by_stop(stop_name, tram_routes):
-    """
-    Знаходить всі трамваї, що проходять через задану зупинку.
-    """
-    trams_by_stop = []
-    for tram, route_info in tram_routes.items():
-        if stop_name in route_info[-1]:
-            trams_by_stop.append(tram)
-    return trams_by_stop
-
-
 def open_tram_through_stops_window():
     """
     Відкриття вікна для перевірки, чи є трамвай, що проходить через всі вибрані зупинки
@@ -560,7 +3702,7 @@ def open_tram_through_stops_window():
     frame = tk.Frame(stops_window)
     frame.pack(pady=10, padx=25)
 
-    all_stops = get_all_stops_sorted(trams)  # Отримуємо список всіх зупинок
+    all_stops = get_all_stops_sorted(get_trams())  # Отримуємо список всіх зупинок
 
     # Створюємо Listbox для вибору декількох зупинок
     stops_listbox = tk.Listbox(frame, selectmode=tk.MULTIPLE, height=10, width=50)
@@ -587,30 +3729,42 @@ def handle_tram_search(stops_listbox, result_text):
         messagebox.showwarning("Недостатньо даних", "Будь ласка, виберіть хоча б одну зупинку.")
         return
 
-    tram = find_tram_through_stops(selected_stops, trams)
-    if tram:
-        result_text.insert(tk.END, f"Трамвай №{tram} проходить через всі вибрані зупинки.")
+    trams_through_stops = find_tram_through_stops(selected_stops, get_trams())
+    if len(trams_through_stops) == 1:
+        result_text.insert(tk.END, f"Трамвай №{trams_through_stops[0]} проходить через всі вибрані зупинки.")
+    elif trams_through_stops:
+        result_text.insert(tk.END, f"Трамваї №{', №'.join(map(str, trams_through_stops))} "
+                                   f"проходять через всі вибрані зупинки.")
     else:
         result_text.insert(tk.END, "Немає трамвая, який проходить через всі ці зупинки.")
 
 
 def find_tram_through_stops(selected_stops, tram_routes):
     """
-    Перевіряє, чи є трамвай, що проходить через всі вибрані зупинки
+    Знаходить усі трамваї, що проходять через всі вибрані зупинки
 
     Параметри:
     - selected_stops: список вибраних зупинок
     - tram_routes: словник маршрутів трамваїв
 
     Повертає:
-    - номер трамваю, якщо він проходить через всі зупинки
-    - None, якщо такого трамваю немає
+    - список номерів усіх трамваїв, що проходять через всі зупинки (порожній, якщо таких немає)
     """
-    for tram, route_info in tram_routes.items():
-        tram_stops = route_info[-1]  # Множина всіх зупинок на маршруті (direct + reverse)
-        if all(stop in tram_stops for stop in selected_stops):
-            return tram
-    return None
+    index = get_network_index(tram_routes)
+    stop_ids = index['stop_ids']
+    stop_trams = index['stop_trams']
+
+    # Intersect the tram bitsets of the selected stops (direct + reverse)
+    tram_bits = -1
+    for stop in selected_stops:
+        if stop not in stop_ids:
+            return []
+        tram_bits &= stop_trams[stop_ids[stop]]
+        if not tram_bits:
+            return []
+    if tram_bits == -1:
+        return []
+    return _trams_from_bits(index, tram_bits)
 
 
 
@@ -624,16 +3778,15 @@ def open_trams_by_stop_window():
     label1 = tk.Label(trams_window, text="Оберіть зупинку з випадаючого списку, щоб побачити доступні трамваї:")
     label1.pack(pady=10)
 
-    all_stops = get_all_stops_sorted(trams)
-
     # Create a dropdown (Combobox) for selecting a stop
     frame = tk.Frame(trams_window)
     frame.pack(pady=10, padx=25)
 
     stop_label = tk.Label(frame, text="Зупинка:")
     stop_label.grid(row=0, column=0, padx=5, pady=5)
-    stop_combobox = ttk.Combobox(frame, values=all_stops)
+    stop_combobox = ttk.Combobox(frame)
     stop_combobox.grid(row=0, column=1, padx=5, pady=5)
+    _bind_stop_search(stop_combobox)
 
     # Text box for displaying trams that go through the selected stop
     result_text = tk.Text(trams_window, height=10, width=50, wrap=tk.WORD)
@@ -643,11 +3796,12 @@ def open_trams_by_stop_window():
         stop_name = stop_combobox.get()
         result_text.delete(1.0, tk.END)
 
-        if stop_name not in all_stops:
+        trams = get_trams()
+        if not is_known_stop(trams, stop_name):
             messagebox.showwarning("Невірна зупинка", "Оберіть зупинку зі списку.")
             return
 
-        trams_at_stop = find_trams_by_stop(stop_name, trams)
+        trams_at_stop = find_trams_by_stop(trams, stop_name)
         if trams_at_stop:
             result_text.insert(tk.END, f"Трамваї, що їдуть через {stop_name}: {', '.join(map(str, trams_at_stop))}")
         else:
@@ -659,6 +3813,570 @@ def open_trams_by_stop_window():
 
 
 
+class ApiError(Exception):
+    """
+    Помилка запиту до JSON API з кодом відповіді HTTP
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _route_to_json(route):
+    """
+    Перетворення маршруту на список об'єктів для відповіді JSON
+
+    route - список кортежів (номер трамваю, список зупинок, кількість зупинок) або None
+    повертає: список словників з ключами tram, stops, count або None
+    """
+    if route is None:
+        return None
+    return [{'tram': tram, 'stops': stops, 'count': count} for tram, stops, count in route]
+
+
+def _api_stop_pair(tram_routes, query):
+    """
+    Отримання та перевірка пари зупинок start, end з параметрів запиту
+
+    повертає: кортеж (початкова зупинка, кінцева зупинка)
+    """
+    start = query.get('start', [''])[0]
+    end = query.get('end', [''])[0]
+    if not start or not end:
+        raise ApiError(400, "Будь ласка, вкажіть параметри start та end.")
+
+    index = get_network_index(tram_routes)
+    if _served_stop_id(index, start) is None or _served_stop_id(index, end) is None:
+        raise ApiError(404, "Маршрут не знайдено. Перевірте коректність введених назв зупинок.")
+    return start, end
+
+
+def _api_route(tram_routes, query):
+    start, end = _api_stop_pair(tram_routes, query)
+    # The alternatives search also caches the best route, so the other calls below are cache hits
+    alternatives = plan_alternatives(tram_routes, start, end)
+    return {'route': _route_to_json(find_best_route(tram_routes, start, end)),
+            'alternatives': [_route_to_json(journey) for journey in alternatives[1:]],
+            'text': create_route_text(tram_routes, start, end)}
+
+
+def _api_stops(tram_routes, query):
+    start, end = _api_stop_pair(tram_routes, query)
+    route = find_best_route(tram_routes, start, end)
+    return {'stops': sum(count for _, _, count in route) if route else None,
+            'transfers': len(route) - 1 if route else None,
+            'text': how_many_stops(tram_routes, start, end)}
+
+
+def _api_reach(tram_routes, query):
+    start, end = _api_stop_pair(tram_routes, query)
+    route = find_best_route(tram_routes, start, end)
+    return {'reachable': bool(route),
+            'trams': [tram for tram, _, _ in route] if route else [],
+            'text': create_can_reach_text(tram_routes, start, end)}
+
+
+def _api_arrival(tram_routes, query):
+    start, end = _api_stop_pair(tram_routes, query)
+    try:
+        departure = parse_clock(query.get('time', [time.strftime('%H:%M')])[0])
+    except ValueError as error:
+        raise ApiError(400, str(error)) from None
+    journey = earliest_arrival(tram_routes, start, end, departure)
+    legs = journey['legs'] if journey else []
+    return {'departure': format_clock(departure),
+            'arrival': format_clock(journey['arrival']) if journey else None,
+            'estimated': journey['estimated'] if journey else [],
+            'legs': [{'tram': tram, 'stops': stops, 'board': format_clock(board), 'alight': format_clock(alight)}
+                     for tram, stops, board, alight in legs],
+            'text': create_arrival_text(tram_routes, start, end, departure)}
+
+
+def _api_reachable(tram_routes, query):
+    stop = query.get('stop', [''])[0]
+    if not stop:
+        raise ApiError(400, "Будь ласка, вкажіть параметр stop.")
+    if _served_stop_id(get_network_index(tram_routes), stop) is None:
+        raise ApiError(404, "Оберіть зупинку зі списку.")
+    limits = {}
+    for name in ('max_stops', 'max_transfers'):
+        value = query.get(name, [''])[0]
+        if value and not value.isdigit():
+            raise ApiError(400, f"Параметр {name} має бути невід'ємним цілим числом.")
+        limits[name] = int(value) if value else None
+    reachable = reachable_stops(tram_routes, stop, **limits)
+    return {'stop': stop, **limits,
+            'reachable': [{'stop': name, 'stops': stops, 'transfers': transfers}
+                          for name, (stops, transfers) in reachable.items()]}
+
+
+def _api_trams_by_stop(tram_routes, query):
+    stop = query.get('stop', [''])[0]
+    if not stop:
+        raise ApiError(400, "Будь ласка, вкажіть параметр stop.")
+    if _served_stop_id(get_network_index(tram_routes), stop) is None:
+        raise ApiError(404, "Оберіть зупинку зі списку.")
+    return {'stop': stop, 'trams': find_trams_by_stop(tram_routes, stop)}
+
+
+def _api_trams_through_stops(tram_routes, query):
+    stops = query.get('stop', [])
+    if not stops:
+        raise ApiError(400, "Будь ласка, вкажіть хоча б одну зупинку параметром stop.")
+    return {'stops': stops, 'trams': find_tram_through_stops(stops, tram_routes)}
+
+
+def _api_all_stops(tram_routes, query):
+    return {'stops': get_all_stops_sorted(tram_routes)}
+
+
+def _api_search_stops(tram_routes, query):
+    text = query.get('q', [''])[0]
+    return {'query': text, 'stops': search_stops(tram_routes, text)}
+
+
+def _api_metrics(tram_routes, query):
+    return metrics.to_dict()
+
+
+API_ENDPOINTS = {
+    '/route': _api_route,
+    '/stops': _api_stops,
+    '/reach': _api_reach,
+    '/arrival': _api_arrival,
+    '/reachable': _api_reachable,
+    '/trams': _api_trams_by_stop,
+    '/through': _api_trams_through_stops,
+    '/all-stops': _api_all_stops,
+    '/search': _api_search_stops,
+    '/metrics': _api_metrics,
+}
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                431: 'Request Header Fields Too Large', 500: 'Internal Server Error'}
+# Most header lines accepted in one request; each line is also limited by the StreamReader buffer (64 KiB)
+MAX_HEADER_LINES = 100
+
+
+def handle_api_request(method, target):
+    """
+    Обробка одного запиту до JSON API
+
+    method - HTTP-метод запиту
+    target - шлях запиту з параметрами, наприклад /route?start=...&end=...
+    повертає: кортеж (код відповіді HTTP, словник для відповіді JSON)
+    """
+    if method != 'GET':
+        return 405, {'error': "Підтримуються лише запити GET."}
+
+    url = urlsplit(target)
+    endpoint = API_ENDPOINTS.get(url.path)
+    if endpoint is None:
+        return 404, {'error': f"Невідомий запит {url.path}", 'endpoints': sorted(API_ENDPOINTS)}
+
+    try:
+        return 200, endpoint(get_trams(), parse_qs(url.query))
+    except ApiError as error:
+        return error.status, {'error': error.message}
+
+
+async def _read_request_head(reader):
+    """
+    Читання рядка запиту та заголовків HTTP
+
+    reader - потік з'єднання
+    повертає: кортеж (рядок запиту, словник заголовків з назвами в нижньому регістрі);
+              порожній рядок запиту, якщо клієнт закрив з'єднання
+    """
+    import asyncio
+
+    try:
+        request_line = await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise ApiError(400, "Задовгий рядок HTTP-запиту.")
+    headers = {}
+    if not request_line.strip():
+        return request_line, headers
+
+    for _ in range(MAX_HEADER_LINES + 1):
+        try:
+            line = await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise ApiError(431, "Задовгий заголовок HTTP-запиту.")
+        if line in (b'\r\n', b'\n', b''):
+            return request_line, headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+    raise ApiError(431, f"Запит має більше ніж {MAX_HEADER_LINES} заголовків.")
+
+
+async def _handle_http_connection(reader, writer):
+    """
+    Обслуговування одного HTTP-з'єднання (з підтримкою keep-alive)
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                request_line, headers = await _read_request_head(reader)
+            except ApiError as error:
+                # The rest of the request cannot be told apart from the next one, so the connection ends here
+                _write_http_response(writer, error.status, {'error': error.message}, False)
+                await writer.drain()
+                break
+            if not request_line.strip():
+                break
+
+            # Request bodies are not used, but must be read so that the next request on the connection
+            # starts at its request line; a body of unknown length ends the connection after the answer
+            content_length = headers.get('content-length', '0')
+            body_framed = content_length.isdigit() and 'transfer-encoding' not in headers
+            if body_framed:
+                remaining = int(content_length)
+                while remaining:
+                    remaining -= len(await reader.readexactly(min(remaining, 65536)))
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) != 3:
+                status, body = 400, {'error': "Некоректний HTTP-запит."}
+            else:
+                # Searches run in the thread pool so that slow queries never stall other clients
+                try:
+                    status, body = await loop.run_in_executor(None, handle_api_request, parts[0], parts[1])
+                except Exception as error:
+                    status, body = 500, {'error': str(error)}
+
+            keep_alive = (body_framed and len(parts) == 3 and parts[2] == 'HTTP/1.1'
+                          and headers.get('connection') != 'close')
+            _write_http_response(writer, status, body, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def _write_http_response(writer, status, body, keep_alive):
+    """
+    Запис відповіді HTTP з тілом JSON
+
+    writer - потік з'єднання
+    status - код відповіді HTTP
+    body - словник для відповіді JSON
+    keep_alive - чи лишати з'єднання відкритим
+    """
+    payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    writer.write((f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                  f"Content-Type: application/json; charset=utf-8\r\n"
+                  f"Content-Length: {len(payload)}\r\n"
+                  f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1')
+                 + payload)
+
+
+async def _serve_api(host, port):
+    import asyncio
+
+    server = await asyncio.start_server(_handle_http_connection, host, port)
+    print(f"Сервер довідки працює на http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def serve_api(host='127.0.0.1', port=8080):
+    """
+    Запуск HTTP-сервера з JSON API без графічного інтерфейсу
+
+    Дані завантажуються один раз під час запуску і спільні для всіх клієнтів.
+
+    host - адреса, на якій приймаються з'єднання
+    port - порт сервера
+    """
+    import asyncio
+
+    get_trams()
+    try:
+        asyncio.run(_serve_api(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+def read_stop_pairs(input_path):
+    """
+    Потокове читання пар зупинок для пакетної обробки
+
+    input_path - шлях до файлу CSV (стовпці start, end) або JSONL (об'єкти з ключами start, end);
+                 значення all означає всі впорядковані пари різних зупинок мережі
+    повертає: генератор кортежів (початкова зупинка, кінцева зупинка)
+    """
+    import csv
+
+    if input_path == 'all':
+        all_stops = get_all_stops_sorted(get_trams())
+        yield from itertools.permutations(all_stops, 2)
+        return
+
+    with open(input_path, 'r', encoding='utf-8', newline='') as file:
+        if input_path.endswith('.jsonl'):
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    pair = json.loads(line)
+                    start, end = pair['start'], pair['end']
+                except (ValueError, KeyError, TypeError):
+                    raise ValueError(f"Рядок {line_number}: очікувався об'єкт JSON з ключами start та end") from None
+                if not isinstance(start, str) or not isinstance(end, str) or not start.strip() or not end.strip():
+                    raise ValueError(f"Рядок {line_number}: start та end мають бути непорожніми рядками")
+                yield start.strip(), end.strip()
+        else:
+            for line_number, row in enumerate(csv.reader(file), 1):
+                if not row:
+                    continue
+                if len(row) < 2:
+                    raise ValueError(f"Рядок {line_number}: очікувались стовпці start та end")
+                if line_number == 1 and [value.strip().lower() for value in row[:2]] == ['start', 'end']:
+                    continue
+                if not row[0].strip() or not row[1].strip():
+                    raise ValueError(f"Рядок {line_number}: start та end мають бути непорожніми рядками")
+                yield row[0].strip(), row[1].strip()
+
+
+def _batch_worker_init():
+    """
+    Підготовка процесу пакетної обробки: дані завантажуються один раз на процес
+    """
+    get_trams()
+
+
+def _batch_query(pair):
+    """
+    Пошук маршруту для однієї пари зупинок у пакетному режимі
+
+    pair - кортеж (початкова зупинка, кінцева зупинка)
+    повертає: рядок JSON з результатом та часом виконання запиту
+    """
+    start, end = pair
+    started = time.perf_counter()
+    route = find_best_route(get_trams(), start, end)
+    elapsed = time.perf_counter() - started
+
+    result = {'start': start, 'end': end, 'route': _route_to_json(route),
+              'stops': sum(count for _, _, count in route) if route else None,
+              'transfers': len(route) - 1 if route else None,
+              'time_ms': round(elapsed * 1000, 3)}
+    if route is None:
+        result['error'] = "Маршрут не знайдено. Перевірте коректність введених назв зупинок."
+    return json.dumps(result, ensure_ascii=False)
+
+
+def run_batch(input_path, output_path='-', workers=None):
+    """
+    Пакетний пошук маршрутів для багатьох пар зупинок з розподілом між процесами
+
+    Результати записуються у форматі JSONL у тому ж порядку, що й пари у вхідному файлі,
+    щойно їх буде обчислено.
+
+    input_path - шлях до файлу з парами зупинок, див. read_stop_pairs
+    output_path - шлях до файлу результатів ('-' - стандартний вивід)
+    workers - кількість процесів (None - за кількістю процесорів, 1 - без окремих процесів)
+    повертає: кількість оброблених пар
+    """
+    import multiprocessing
+
+    workers = workers or os.cpu_count() or 1
+    pairs = read_stop_pairs(input_path)
+    output = sys.stdout if output_path == '-' else open(output_path, 'w', encoding='utf-8')
+    started = time.perf_counter()
+    count = 0
+    pool = None
+
+    try:
+        if workers == 1:
+            results = map(_batch_query, pairs)
+        else:
+            pool = multiprocessing.Pool(workers, initializer=_batch_worker_init)
+            results = pool.imap(_batch_query, pairs, chunksize=64)
+
+        for line in results:
+            output.write(line + '\n')
+            count += 1
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            # Workers must not outlive a run stopped by a write error or Ctrl+C
+            pool.terminate()
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Оброблено пар: {count} за {elapsed:.2f} с ({count / elapsed if elapsed else 0:.0f} запитів/с, "
+          f"процесів: {workers})", file=sys.stderr)
+    return count
+
+
+def generate_synthetic_network(file_path, routes, stops, route_length=20, overlap=0.3, seed=42):
+    """
+    Створення файлу у форматі TramsInfo.txt зі штучною мережею заданого розміру
+
+    Частина зупинок кожного маршруту береться зі спільного набору пересадкових вузлів,
+    решта - послідовно із загального списку зупинок, тож мережа зв'язна, а всі зупинки використані.
+
+    file_path - шлях до файлу, який буде створено
+    routes - кількість маршрутів
+    stops - загальна кількість зупинок
+    route_length - кількість зупинок на маршруті
+    overlap - частка зупинок маршруту, спільних з іншими маршрутами (від 0 до 1)
+    seed - початкове значення генератора випадкових чисел
+    """
+    rng = random.Random(seed)
+    names = [f"Зупинка {i}" for i in range(stops)]
+    hubs = names[:max(1, int(stops * overlap))]
+    local_stops = names[len(hubs):] or hubs
+    shared_count = min(len(hubs), int(route_length * overlap))
+    next_local = 0
+
+    with open(file_path, 'w', encoding='utf-8') as file:
+        for number in range(1, routes + 1):
+            direct_route = [local_stops[(next_local + i) % len(local_stops)]
+                            for i in range(route_length - shared_count)]
+            next_local += len(direct_route)
+            for hub in rng.sample(hubs, shared_count):
+                direct_route.insert(rng.randrange(len(direct_route) + 1), hub)
+            direct_route = list(dict.fromkeys(direct_route))
+
+            file.write(f"{number:02d}\n{direct_route[0]} - {direct_route[-1]}\n"
+                       f"{DIRECT_ROUTE_PREFIX}{' - '.join(direct_route)}\n"
+                       f"{REVERSE_ROUTE_PREFIX}{' - '.join(reversed(direct_route))}\n")
+
+
+def _timing_stats(samples):
+    """
+    Підрахунок статистики часу виконання
+
+    samples - список тривалостей у секундах
+    повертає: словник з кількістю запусків, середнім, перцентилями та пропускною здатністю
+    """
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    total = sum(ordered)
+    return {
+        'runs': len(ordered),
+        'mean_ms': total / len(ordered) * 1000,
+        'p50_ms': percentile(0.5),
+        'p90_ms': percentile(0.9),
+        'p99_ms': percentile(0.99),
+        'max_ms': ordered[-1] * 1000,
+        'ops_per_s': len(ordered) / total if total else None,
+    }
+
+
+def _measure(function, arguments):
+    """
+    Вимірювання часу виконання функції для кожного набору аргументів та пікового використання пам'яті
+
+    function - функція, що вимірюється
+    arguments - список кортежів аргументів, по одному на запуск
+    повертає: статистика часу, див. _timing_stats, з ключем peak_memory_bytes
+    """
+    import tracemalloc
+
+    samples = []
+    for args in arguments:
+        started = time.perf_counter()
+        function(*args)
+        samples.append(time.perf_counter() - started)
+
+    # Memory is traced in a separate pass so that tracing does not distort the timings
+    tracemalloc.start()
+    for args in arguments[:50]:
+        function(*args)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    stats = _timing_stats(samples)
+    stats['peak_memory_bytes'] = peak_memory
+    return stats
+
+
+def run_benchmark(sizes=(10, 50, 200), queries=500, route_length=20, overlap=0.3, repeats=5, seed=42):
+    """
+    Вимірювання швидкодії розбору даних, пошуку зупинок і маршрутів на штучних мережах різного розміру
+
+    sizes - кількості маршрутів у мережах, що перевіряються
+    queries - кількість запитів для кожної функції пошуку
+    route_length - кількість зупинок на маршруті
+    overlap - частка спільних зупинок маршрутів
+    repeats - кількість повторів розбору файлу та сортування зупинок
+    seed - початкове значення генератора випадкових чисел
+    повертає: словник з результатами для кожного розміру мережі
+    """
+    import tempfile
+
+    rng = random.Random(seed)
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for routes in sizes:
+            stops = max(route_length, routes * route_length // 2)
+            file_path = os.path.join(directory, f"network_{routes}.txt")
+            generate_synthetic_network(file_path, routes, stops, route_length, overlap, seed)
+
+            tram_routes = process_tram_file(file_path)
+            all_stops = get_all_stops_sorted(tram_routes)
+
+            def sort_stops():
+                get_network_index(tram_routes)['stops_sorted'] = None
+                get_all_stops_sorted(tram_routes)
+
+            def find_route(start, end):
+                journey_cache.clear()
+                find_best_route(tram_routes, start, end)
+
+            pairs = [tuple(rng.sample(all_stops, 2)) for _ in range(queries)]
+            selections = [rng.sample(all_stops, rng.randint(2, 3)) for _ in range(queries)]
+
+            results.append({
+                'routes': routes,
+                'stops': len(all_stops),
+                'route_length': route_length,
+                'file_bytes': os.path.getsize(file_path),
+                'process_tram_file': _measure(process_tram_file, [(file_path,)] * repeats),
+                'get_all_stops_sorted': _measure(sort_stops, [()] * repeats),
+                'find_trams_by_stop': _measure(find_trams_by_stop,
+                                               [(tram_routes, start) for start, _ in pairs]),
+                'find_tram_through_stops': _measure(find_tram_through_stops,
+                                                    [(selection, tram_routes) for selection in selections]),
+                'find_best_route': _measure(find_route, pairs),
+            })
+
+    return {'python': sys.version.split()[0], 'queries': queries, 'overlap': overlap, 'sizes': results}
+
+
+def write_metrics(file_path):
+    """
+    Запис зібраних метрик у файл JSON
+
+    file_path - шлях до файлу (- для виведення таблиці етапів у stderr)
+    """
+    if file_path == '-':
+        print(metrics.format_text(), file=sys.stderr)
+        return
+    with open(file_path, 'w', encoding='utf-8') as file:
+        json.dump(metrics.to_dict(), file, ensure_ascii=False, indent=2)
+
+
 def main():
     """
     Головна функція для запуску головного вікна програми
@@ -719,11 +4437,92 @@ def main():
 
     button7 = tk.Button(button_frame, text="Перевірити трамвай за зупинками", width=30, height=2,
                         command=open_tram_through_stops_window)  
-    button7.grid(row=2, column=0, columnspan=3, pady=10)  
+    button7.grid(row=2, column=0, columnspan=2, pady=10)  
+
+    button8 = tk.Button(button_frame, text="Коли я приїду", width=30, height=2,
+                        command=open_arrival_window)
+    button8.grid(row=2, column=2, padx=5, pady=10)
+
+    # Load the route data once the window is shown instead of before it
+    root.after_idle(get_trams)
 
     # Start the main loop
     root.mainloop()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Довідка про Львівський трамвай")
+    parser.add_argument('--build-matrices', action='store_true',
+                        help=f"обчислити матриці відстаней між усіма зупинками у {DISTANCE_MATRICES_FILE}")
+    parser.add_argument('--build-snapshot', action='store_true',
+                        help=f"записати бінарний знімок даних у {snapshot_path(TRAMS_FILE)}")
+    parser.add_argument('--self-test', action='store_true',
+                        help="записати протокол тестування у InternalProtocole.txt")
+    parser.add_argument('--serve', action='store_true',
+                        help="запустити HTTP-сервер з JSON API замість графічного інтерфейсу")
+    parser.add_argument('--host', default='127.0.0.1', help="адреса HTTP-сервера (за замовчуванням 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8080, help="порт HTTP-сервера (за замовчуванням 8080)")
+    parser.add_argument('--batch', metavar='INPUT',
+                        help="знайти маршрути для пар зупинок з файлу CSV/JSONL (all - для всіх пар зупинок)")
+    parser.add_argument('--output', default='-', help="файл JSONL для результатів --batch (за замовчуванням stdout)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="кількість процесів для --batch (за замовчуванням - кількість процесорів)")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="виміряти швидкодію на штучних мережах і записати JSON у --output")
+    parser.add_argument('--benchmark-sizes', default='10,50,200',
+                        help="кількості маршрутів у штучних мережах через кому (за замовчуванням 10,50,200)")
+    parser.add_argument('--benchmark-queries', type=int, default=500,
+                        help="кількість запитів для кожної функції пошуку (за замовчуванням 500)")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="збирати метрики швидкодії і записати їх у файл JSON при завершенні (- для stderr)")
+    parser.add_argument('--watch', type=float, nargs='?', const=RELOAD_INTERVAL, metavar='SECONDS',
+                        help=f"перевіряти зміни у {TRAMS_FILE} і перезавантажувати дані без перезапуску "
+                             f"(кожні {RELOAD_INTERVAL:g} с, якщо не вказано)")
+    parser.add_argument('--gtfs', metavar='FEED',
+                        help="імпортувати трамвайні маршрути з фіду GTFS (каталог або zip) і записати їх "
+                             "у форматі TramsInfo.txt у --output")
+    parser.add_argument('--profile', action='store_true',
+                        help="зберігати профіль cProfile для кожного пошуку маршруту (разом з --metrics)")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enabled = True
+        metrics.profile = args.profile
+        atexit.register(write_metrics, args.metrics)
+    if args.watch is not None:
+        watch_trams_file(args.watch)
+
+    if args.build_snapshot:
+        write_snapshot(process_tram_file(TRAMS_FILE), TRAMS_FILE, snapshot_path(TRAMS_FILE))
+    elif args.build_matrices:
+        save_distance_matrices(build_distance_matrices(get_trams()), DISTANCE_MATRICES_FILE)
+    elif args.self_test:
+        get_protocole_of_testing()
+    elif args.serve:
+        serve_api(args.host, args.port)
+    elif args.batch:
+        # Report bad input as one line instead of a traceback from the worker pool
+        try:
+            run_batch(args.batch, args.output, args.workers)
+        except (OSError, ValueError) as error:
+            sys.exit(f"{args.batch}: {error}")
+    elif args.gtfs:
+        try:
+            trams, report = import_gtfs(args.gtfs)
+        except (OSError, ValueError) as error:
+            sys.exit(str(error))
+        if args.output == '-':
+            write_tram_file(trams, sys.stdout)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                write_tram_file(trams, file)
+        print(json.dumps(report, ensure_ascii=False), file=sys.stderr)
+    elif args.benchmark:
+        report = run_benchmark([int(size) for size in args.benchmark_sizes.split(',')], args.benchmark_queries)
+        if args.output == '-':
+            json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+    else:
+        main()